@@ -6,11 +6,10 @@ from django.conf import settings
 from arches.app.models.models import ResourceInstance
 from arches.app.models.resource import Resource
 
-from fpan.search.components.rule_filter import RuleFilter
 from hms.permissions_backend import (
     user_is_land_manager,
     user_is_scout,
-    get_rule_by_graph,
+    user_can_access,
 )
 
 logger = logging.getLogger(__name__)
@@ -39,18 +38,7 @@ def can_access_site_or_report(function):
         if resourceid is None:
             raise Http404
 
-        graphid = str(ResourceInstance.objects.get(pk=resourceid).graph.pk)
-        allowed = False
-
-        rule = get_rule_by_graph(request.user, graphid=graphid)
-
-        if rule.type == "full_access":
-            allowed = True
-        elif rule.type == "no_access":
-            allowed = False
-        else:
-            resids = RuleFilter().get_resources_from_rule(rule, ids_only=True)
-            allowed = resourceid in resids
+        allowed = user_can_access(request.user, resourceid)
 
         logger.debug(f"can_access_site_or_report {allowed}: {time.time() - start}")
         if allowed:
@@ -1,7 +1,9 @@
-import gc
 import os
 import csv
+import json
+import math
 import time
+import multiprocessing
 import uuid
 import logging
 import zipfile
@@ -9,11 +11,14 @@ from datetime import datetime
 from pathlib import Path
 
 from django.contrib.gis.gdal.datasource import DataSource
-from django.contrib.gis.db.models import Union as UnionGeoms
-from django.db import connection
+from django.db import connection, connections
 from django.db.utils import IntegrityError, ProgrammingError
+from django.core.cache import cache
 from django.core.files.storage import default_storage
 from django.conf import settings
+from psycopg2 import Binary
+from psycopg2.extras import execute_values
+import billiard
 
 from arches.app.datatypes.datatypes import DataTypeFactory
 from arches.app.etl_modules.base_import_module import BaseImportModule
@@ -23,15 +28,19 @@ from arches.app.models.models import (
     Node,
     NodeGroup,
     ETLModule,
-    ResourceInstance,
 )
-from arches.app.models.resource import Resource
 from arches.app.utils.index_database import index_resources_by_transaction
 
-from hms.fmsf import FMSFResource
-from hms.models import ManagementArea
-from fpan.tasks import run_fmsf_import_as_task
-from fpan.utils import ETLOperationResult, SpatialJoin
+from hms.fmsf import FMSFResource, get_feature_siteid
+from hms.permissions_backend import refresh_accessible_resources
+from fpan.tasks import queue_cluster_pyramid_refresh, run_fmsf_import_as_task
+from fpan.utils import (
+    ETLOperationResult,
+    SpatialJoin,
+    bump_mvt_generation,
+    defer_mvt_invalidation,
+    get_rdm_cache_version,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -178,6 +187,15 @@ specials = {
     },
 }
 
+## label indexes are also invalidated by a new RDM cache version, this timeout
+## just keeps stale versions from lingering in the cache
+LABEL_INDEX_CACHE_TIMEOUT = 60 * 60 * 24
+
+## the stages of run_sequence() that have been completed are listed under this
+## key in load_details, and the ids of the sites to load are kept in this file
+CHECKPOINT_KEY = "Completed stages"
+SITEIDS_CHECKPOINT_FILE = "checkpoint-new-siteids.json"
+
 FILENAME_LOOKUP = {
     "Archaeological Site": {"shp_name": "FloridaSites.shp", "csv_name": "AR.csv"},
     "Historic Cemetery": {
@@ -220,16 +238,17 @@ class FMSFImporter(BaseImportModule):
         self.field_map = {}
         self.extra_structures_csv = None
 
-        # holding and managing feature content during the import process
-        self.features = []
-        self.new_features = []
-        self.existing_features = []
-        self.tiles = []
-        self.fmsf_resources = []
+        # holding and managing feature content during the import process. GDAL
+        # features are never held here, only the ids of the sites to load and,
+        # once they are staged, the (siteid, resourceid) of each new resource.
+        self.new_siteids = set()
+        self.loaded_resources = []
         self.extra_structures = []
 
         self.blank_tile_lookup = {}
         self.concept_lookups = {}
+        self.geojson_lookup = {}
+        self.label_misses = {}
         self.node_lookup = {}
         self.nodegroup_lookup = {}
         self.resource_lookup = {}
@@ -251,18 +270,48 @@ class FMSFImporter(BaseImportModule):
         self.field_map = field_maps[resource_type]
 
     def _set_resource_lookup(self):
+        """
+        Creates a lookup of FMSF ID to resourceinstanceid for all existing
+        resources in the graph, with a single query over the FMSF ID tiles.
+        """
 
         self.reporter.stage = "creating resource lookup"
         self.update_status_and_load_details("running")
 
-        resources = Resource.objects.filter(graph=self.graph)
-        for resource in resources:
-            try:
-                siteid = resource.get_node_values("FMSF ID")[0]
-            except IndexError:
-                logger.warning(f"orphan resource: {resource.pk} has no FMSF ID")
-                continue
-            self.resource_lookup[siteid["en"]["value"]] = resource
+        siteid_node = self.get_node("FMSF ID")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """SELECT tiledata -> %(nodeid)s -> 'en' ->> 'value', resourceinstanceid
+                FROM tiles WHERE nodegroupid = %(nodegroupid)s;""",
+                {
+                    "nodeid": str(siteid_node.pk),
+                    "nodegroupid": siteid_node.nodegroup_id,
+                },
+            )
+            for siteid, resourceid in cursor.fetchall():
+                if siteid is None:
+                    continue
+                self.resource_lookup[siteid] = str(resourceid)
+
+            cursor.execute(
+                """SELECT count(*) FROM resource_instances r
+                WHERE r.graphid = %(graphid)s AND NOT EXISTS (
+                    SELECT 1 FROM tiles t
+                    WHERE t.resourceinstanceid = r.resourceinstanceid
+                    AND t.nodegroupid = %(nodegroupid)s
+                    AND t.tiledata -> %(nodeid)s -> 'en' ->> 'value' IS NOT NULL
+                );""",
+                {
+                    "graphid": self.graph.pk,
+                    "nodeid": str(siteid_node.pk),
+                    "nodegroupid": siteid_node.nodegroup_id,
+                },
+            )
+            orphan_ct = cursor.fetchone()[0]
+        if orphan_ct > 0:
+            logger.warning(f"{orphan_ct} orphan resources have no FMSF ID")
+
+        logger.debug(f"{len(self.resource_lookup)} existing resources in lookup")
 
     def delete_from_default_storage(self, directory):
         dirs, files = default_storage.listdir(directory)
@@ -354,14 +403,25 @@ class FMSFImporter(BaseImportModule):
             "rows": rows,
         }
 
-    def _read_resource_csv(self):
-
-        rows = self._get_csv_content()["rows"]
+    def _read_resource_csv(self, siteids):
+        """
+        Reads the CSV rows for the given site ids into self.csv_data. This is
+        called once per chunk of features, streaming the file each time, so
+        only the rows for the current chunk are held in memory.
+        """
 
-        data = {}
-        for row in rows:
-            siteid = row["SiteID"].rstrip()
-            data[siteid] = data.get(siteid, []) + [row]
+        for encoding in ("utf-8-sig", "ISO-8859-1"):
+            data = {}
+            try:
+                with open(self.resource_csv, "r", encoding=encoding) as in_csv:
+                    for row in csv.DictReader(in_csv):
+                        siteid = row["SiteID"].rstrip()
+                        if siteid in siteids:
+                            data.setdefault(siteid, []).append(row)
+            except UnicodeDecodeError:
+                # not UTF encoded, so try ISO-8859-1 (common in windows)
+                continue
+            break
 
         self.csv_data = data
 
@@ -377,31 +437,98 @@ class FMSFImporter(BaseImportModule):
                     value = form_value
         return value
 
+    def get_label_index(self, collectionid):
+        """
+        Returns a dict of prefLabel to labelid for all concepts in the given
+        collection. Indexes are held on this instance for the whole import, and
+        stored in the cache between imports under the current RDM cache version.
+        """
+
+        index = self.concept_lookups.get(collectionid)
+        if index is None:
+            key = f"fmsf_label_index_{get_rdm_cache_version()}_{collectionid}"
+            index = cache.get(key)
+            if index is None:
+                index = {}
+                for triple in Concept().get_child_collections(collectionid):
+                    # keep the first match for a label, as the old linear scan did
+                    index.setdefault(triple[1], triple[2])
+                cache.set(key, index, LABEL_INDEX_CACHE_TIMEOUT)
+            self.concept_lookups[collectionid] = index
+        return index
+
     def lookup_labelid_from_label(self, value, node):
         """This is a pretty simplistic approach, which should work for FMSF but
-        may not with a nested RDM collection."""
+        may not with a nested RDM collection. Labels that aren't found are
+        collected in self.label_misses and reported at the end of the run."""
 
-        collectionid = node.config["rdmCollection"]
-        if collectionid not in self.concept_lookups:
-            concepts = Concept().get_child_collections(node.config["rdmCollection"])
-            self.concept_lookups[collectionid] = concepts
+        index = self.get_label_index(node.config["rdmCollection"])
 
         # Allow some special handling of certan known typos in the FMSF
         if node.name in self.special_label_lookups:
             if value in self.special_label_lookups[node.name]:
                 value = self.special_label_lookups[node.name][value]
 
-        labelid = None
-        for triple in self.concept_lookups[collectionid]:
-            if triple[1] == value:
-                labelid = triple[2]
-                break
+        labelid = index.get(value)
         if labelid is None:
-            logger.warn(
-                f"Invalid prefLabel {value} for node {node.name} with collection {node.config['rdmCollection']}"
-            )
+            self.label_misses.setdefault(node.name, set()).add(value)
         return labelid
 
+    def merge_label_misses(self, label_misses):
+
+        for node_name, values in label_misses.items():
+            self.label_misses.setdefault(node_name, set()).update(values)
+
+    def report_label_misses(self):
+        """Writes all invalid prefLabels encountered in this run to the reporter,
+        along with a single summary warning in the log."""
+
+        if not self.label_misses:
+            return
+        misses = {k: sorted([str(i) for i in v]) for k, v in self.label_misses.items()}
+        self.reporter.data["Invalid prefLabels"] = misses
+        logger.warning(
+            f"{sum([len(v) for v in misses.values()])} invalid prefLabels: "
+            + "; ".join([f"{k}: {', '.join(v)}" for k, v in misses.items()])
+        )
+
+    def sanitize_geometries(self, features, batch_size=None):
+        """
+        Repairs the geometry of each feature with ST_MakeValid and
+        ST_RemoveRepeatedPoints, sending the geometries to the database in
+        large batches. The resulting GeoJSON strings are held in
+        self.geojson_lookup by SITEID (as returned by get_feature_siteid()), and
+        used in FMSFResource.generate_tiles().
+        """
+
+        if batch_size is None:
+            batch_size = settings.FMSF_GEOMETRY_BATCH_SIZE
+
+        batch = []
+        for feature in features:
+            batch.append((get_feature_siteid(feature), feature_to_wkb(feature)))
+            if len(batch) == batch_size:
+                self._sanitize_geometry_batch(batch)
+                batch = []
+        if len(batch) > 0:
+            self._sanitize_geometry_batch(batch)
+
+    def _sanitize_geometry_batch(self, batch):
+
+        siteids = [i[0] for i in batch]
+        wkbs = [i[1] for i in batch]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """SELECT siteid, ST_AsGeoJSON(
+                    ST_RemoveRepeatedPoints(
+                        ST_MakeValid(ST_GeomFromWKB(wkb))
+                    )
+                ) FROM unnest(%s::text[], %s::bytea[]) AS g(siteid, wkb);""",
+                [siteids, wkbs],
+            )
+            for siteid, geojson in cursor.fetchall():
+                self.geojson_lookup[siteid] = geojson
+
     def validate_files(self, file_dir):
 
         def validate_shp_fields(layer_fields):
@@ -501,6 +628,40 @@ class FMSFImporter(BaseImportModule):
         self.reporter.message = f"etl started with loadid: {self.loadid}"
         return
 
+    def iter_new_features(self, truncate=None):
+        """
+        Yields the GDAL features from the shapefile whose SITEID is in
+        self.new_siteids, reading the layer one feature at a time so that the
+        full export is never held in memory.
+        """
+
+        ds = DataSource(self.resource_shp)
+        lyr = ds[0]
+
+        yielded = 0
+        for feature in lyr:
+            if truncate and yielded >= truncate:
+                break
+            if get_feature_siteid(feature) not in self.new_siteids:
+                continue
+            yielded += 1
+            yield feature
+
+    def iter_new_feature_chunks(self, truncate=None, chunk_size=None):
+        """Yields lists of new features, each no longer than chunk_size."""
+
+        if chunk_size is None:
+            chunk_size = settings.FMSF_IMPORT_CHUNK_SIZE
+
+        chunk = []
+        for feature in self.iter_new_features(truncate=truncate):
+            chunk.append(feature)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if len(chunk) > 0:
+            yield chunk
+
     def apply_historical_structures_filter(self, only_extra_ids=False):
 
         self.reporter.stage = "filtering"
@@ -523,160 +684,199 @@ class FMSFImporter(BaseImportModule):
                     extra_ids.append(row[0])
         logger.debug(f"extra ids to import: {len(extra_ids)}")
 
-        extra_list, lighthouse_list, geom_list = [], [], []
-        for feature in self.new_features:
-            siteid = feature.get("SITEID").rstrip()
-            # include any special ids
-            if siteid in extra_ids:
-                extra_list.append(siteid)
-                continue
-            # if only_extra_ids, skip all the rest of the resources
-            if only_extra_ids is True:
-                continue
+        batch_size = settings.FMSF_GEOMETRY_BATCH_SIZE
 
-            # skip structure marked as destroyed
-            if _feature_is_destroyed(feature):
-                continue
-            # now, collect sites that are (or were) lighthouses
-            if _feature_is_lighthouse(feature):
-                lighthouse_list.append(siteid)
-            # for all others, collect geometry to filter by location
-            else:
-                geom_list.append((siteid, feature.geom.wkt))
-
-        # CREATE AND RUN GEOMETRY FILTER AGAINST SELECTED MANAGEMENT AREAS
-        geom_matches = []
-        union_geom = None
-        if len(geom_list) > 0:
-            logger.debug("unioning Management Areas")
-            filter_areas = ManagementArea.objects.exclude(
-                category__name__in=["FPAN Region", "County"]
+        # structure geometries are streamed into a temp table in batches as WKB
+        # arrays, and then intersected with the management areas in PostGIS
+        extra_list, lighthouse_list, geom_matches = [], [], set()
+        geom_ct = 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                DROP TABLE IF EXISTS historic_structures_tmp;
+                CREATE TEMP TABLE historic_structures_tmp (siteid varchar, geom geometry);
+                """
             )
-            try:
-                union_results = filter_areas.aggregate(UnionGeoms("geom"))
-            except Exception as e:
-                self.reporter.success = False
-                self.reporter.message = str(e)
-                return
 
-            union_geom = union_results["geom__union"]
-            logger.debug("union geom created")
-
-            values_str = ", ".join([f"('{i[0]}', '{i[1]}')" for i in geom_list])
-            with connection.cursor() as cursor:
-                logger.debug(
-                    f"generate table of structure geoms. geom ct: {len(geom_list)}"
-                )
-                cursor.execute(
-                    f"""
-                    DROP TABLE IF EXISTS historic_structures_tmp;
-                    CREATE TABLE historic_structures_tmp (siteid varchar, geom geometry);
-                    INSERT INTO historic_structures_tmp VALUES {values_str};
-                    """
-                )
+            geom_batch = []
+            for feature in self.iter_new_features():
+                siteid = get_feature_siteid(feature)
+                # include any special ids
+                if siteid in extra_ids:
+                    extra_list.append(siteid)
+                    continue
+                # if only_extra_ids, skip all the rest of the resources
+                if only_extra_ids is True:
+                    continue
+
+                # skip structure marked as destroyed
+                if _feature_is_destroyed(feature):
+                    continue
+                # now, collect sites that are (or were) lighthouses
+                if _feature_is_lighthouse(feature):
+                    lighthouse_list.append(siteid)
+                # for all others, collect geometry to filter by location
+                else:
+                    geom_batch.append((siteid, feature_to_wkb(feature)))
+                    if len(geom_batch) == batch_size:
+                        self._insert_structure_geometries(cursor, geom_batch)
+                        geom_ct += len(geom_batch)
+                        geom_batch = []
+            if len(geom_batch) > 0:
+                self._insert_structure_geometries(cursor, geom_batch)
+                geom_ct += len(geom_batch)
+            logger.debug(f"generated table of structure geoms. geom ct: {geom_ct}")
+            cursor.execute("ANALYZE historic_structures_tmp;")
+
+        # RUN GEOMETRY FILTER AGAINST SELECTED MANAGEMENT AREAS
+        # each structure is tested against the spatial index on the areas, and
+        # the matching ids are read with a server-side cursor
+        try:
+            if geom_ct > 0:
                 logger.debug("performing intersect operation")
-                cursor.execute(
-                    f"""SELECT siteid, geom FROM historic_structures_tmp
-                        WHERE ST_Intersects(geom, '{union_geom.wkt}');"""
+                with connection.chunked_cursor() as cursor:
+                    cursor.execute(
+                        """SELECT hs.siteid FROM historic_structures_tmp hs
+                        WHERE EXISTS (
+                            SELECT 1 FROM hms_managementarea ma
+                            LEFT JOIN hms_managementareacategory mac
+                                ON mac.id = ma.category_id
+                            WHERE ST_Intersects(ma.geom, hs.geom)
+                                AND (
+                                    mac.name IS NULL
+                                    OR mac.name NOT IN ('FPAN Region', 'County')
+                                )
+                        );"""
+                    )
+                    for row in cursor:
+                        geom_matches.add(row[0])
+                logger.debug(
+                    f"intersect complete, {len(geom_matches)} matching features."
                 )
-                rows = cursor.fetchall()
-                geom_matches = [i[0] for i in rows]
+        except Exception as e:
+            self.reporter.success = False
+            self.reporter.message = str(e)
+            return
+        finally:
+            with connection.cursor() as cursor:
                 cursor.execute("""DROP TABLE IF EXISTS historic_structures_tmp;""")
-            logger.debug(f"intersect complete, {len(geom_matches)} matching features.")
 
-        use_list = set(lighthouse_list + geom_matches + extra_list)
-
-        original_ct = len(self.new_features)
-
-        self.new_features = [
-            i for i in self.new_features if i.get("SITEID") in use_list
-        ]
-        final_features = [i for i in self.new_features if i.get("SITEID") in use_list]
-        del self.new_features
-        del union_geom
-        gc.collect()
+        use_list = set(lighthouse_list + extra_list) | geom_matches
 
-        self.new_features = final_features
+        original_ct = len(self.new_siteids)
+        self.new_siteids = self.new_siteids & use_list
 
         self.reporter.message = (
-            f"{len(self.new_features)} out of {original_ct} left after structure filter"
+            f"{len(self.new_siteids)} out of {original_ct} left after structure filter"
         )
-        self.reporter.data["Filtered structures"] = len(self.new_features)
+        self.reporter.data["Filtered structures"] = len(self.new_siteids)
         return
 
+    def _insert_structure_geometries(self, cursor, batch):
+
+        cursor.execute(
+            """INSERT INTO historic_structures_tmp (siteid, geom)
+            SELECT s.siteid, ST_SetSRID(ST_GeomFromWKB(s.wkb), 4326)
+            FROM unnest(%s::text[], %s::bytea[]) AS s(siteid, wkb);""",
+            [[i[0] for i in batch], [i[1] for i in batch]],
+        )
+
     def read_features_from_shapefile(self):
+        """
+        Makes a single pass through the shapefile, classifying each feature
+        against self.resource_lookup. Only the ids of new sites are kept, the
+        features themselves are read again as they are needed.
+        """
 
         self.reporter.stage = "reading shapefile features"
         self.update_status_and_load_details("running")
         ds = DataSource(self.resource_shp)
         lyr = ds[0]
 
+        existing_ct = 0
         for feature in lyr:
-            self.features.append(feature)
-            siteid = feature.get("SITEID").rstrip()
+            siteid = get_feature_siteid(feature)
             if siteid in self.resource_lookup:
-                self.existing_features.append(feature)
+                existing_ct += 1
             else:
-                self.new_features.append(feature)
+                self.new_siteids.add(siteid)
 
-        self.reporter.data["Sites already in database"] = len(self.existing_features)
-        self.reporter.data["New sites in uploaded data"] = len(self.new_features)
-        self.reporter.message = f"features: new - {len(self.new_features)}, existing {len(self.existing_features)}"
+        self.reporter.data["Sites already in database"] = existing_ct
+        self.reporter.data["New sites in uploaded data"] = len(self.new_siteids)
+        self.reporter.message = (
+            f"features: new - {len(self.new_siteids)}, existing {existing_ct}"
+        )
 
         self.reporter.log(logger)
         return
 
-    def generate_load_data(self, truncate=None):
+    def generate_load_data(self, truncate=None, workers=None, chunk_size=None):
+        """
+        Streams the new features from the shapefile in chunks. Each chunk has
+        its geometries sanitized and its CSV rows read, is transformed into tile
+        rows, and those rows are written to load_staging before the next chunk
+        is read, so memory use is bounded by the chunk size rather than the
+        size of the export.
+        """
 
         self.reporter.stage = "generating load data"
         self.update_status_and_load_details("validated")
 
-        logger.debug("reading csv")
-        self._read_resource_csv()
-
-        self.tiles = []
-        self.fmsf_resources = []
+        self.loaded_resources = []
+        self.label_misses = {}
+        self.reporter.data["Tiles staged"] = 0
+
+        if workers is None:
+            workers = settings.FMSF_IMPORT_WORKERS
+
+        pool = None
+        if workers > 1:
+            # forked workers must not share the parent's database connection
+            connections.close_all()
+            pool = billiard.Pool(
+                workers,
+                initializer=_init_tile_worker,
+                initargs=(self.resource_type, self.loadid, str(self.file_dir)),
+            )
 
         logger.debug("generating load data")
         start = time.time()
-        current_percent = 0
-        for n, feature in enumerate(self.new_features, start=1):
-            percent = int(n / len(self.new_features) * 100)
-            if percent != current_percent:
-                if percent == 1:
-                    elapsed = time.time() - start
-                    est = int(elapsed * 100)
-                    logger.debug(f"estimated completion: {round(est / 60, 2)} min")
-                if percent == 100:
-                    logger.debug(percent)
-                elif percent % 5 == 0:
-                    logger.debug(percent)
-                current_percent = percent
-
-            res = FMSFResource.from_shp_feature(feature)
-            if res.siteid in self.resource_lookup:
-                res.resource = self.resource_lookup[res.siteid]
-                res.resourceid = str(self.resource_lookup[res.siteid].pk)
-            else:
-                res.resource = None
-                res.resourceid = str(uuid.uuid4())
-
-            tiles = res.generate_tiles(self)
-
-            self.tiles += tiles
-            self.fmsf_resources.append(res)
+        try:
+            for features in self.iter_new_feature_chunks(
+                truncate=truncate, chunk_size=chunk_size
+            ):
+                self.sanitize_geometries(features)
+                self._read_resource_csv(set([get_feature_siteid(i) for i in features]))
+                if pool is not None:
+                    tiles, resources = self._generate_load_data_parallel(
+                        features, pool, workers
+                    )
+                else:
+                    tiles, resources = self._generate_load_data_serial(features)
+                self.geojson_lookup = {}
 
-            if n == truncate:
-                break
+                self.write_data_to_load_staging(tiles)
+                self.loaded_resources += resources
+                logger.debug(
+                    f"{len(self.loaded_resources)} features processed "
+                    f"({round(time.time() - start, 2)}s)"
+                )
+                self.update_status_and_load_details("validated")
+        except Exception as e:
+            self.reporter.success = False
+            self.reporter.message = str(e)
+            self.reporter.log(logger)
+            return
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
 
-        self.reporter.message = (
-            f"resources: {len(self.fmsf_resources)}, tiles: {len(self.tiles)}"
-        )
-        self.reporter.data["Features to load"] = len(self.fmsf_resources)
-        self.reporter.data["Tiles to load"] = len(self.tiles)
-        self.reporter.data["New FMSF site ids"] = [
-            i.siteid for i in self.fmsf_resources
-        ]
+        self.reporter.message = f"resources: {len(self.loaded_resources)}, tiles: {self.reporter.data['Tiles staged']}"
+        self.reporter.data["Features to load"] = len(self.loaded_resources)
+        self.reporter.data["Tiles to load"] = self.reporter.data["Tiles staged"]
+        self.reporter.data["New FMSF site ids"] = [i[0] for i in self.loaded_resources]
+        self.report_label_misses()
 
         # This summary file of ids was a nice idea, but it is failing because
         # of file permissions: apache creates the directory, and then celery
@@ -687,7 +887,7 @@ class FMSFImporter(BaseImportModule):
         #            with open(csv_summary_file, "w") as f:
         #                writer = csv.writer(f)
         #                writer.writerow(("SITEID", "ResourceId"))
-        #                writer.writerows([(i.siteid, i.resourceid) for i in self.fmsf_resources])
+        #                writer.writerows(self.loaded_resources)
         #        except Exception as e:
         #            logger.info("error trying to write csv, probably a dumb error")
         #            logger.info(e)
@@ -695,40 +895,109 @@ class FMSFImporter(BaseImportModule):
         self.reporter.log(logger)
         return
 
-    def write_data_to_load_staging(self):
+    def _generate_load_data_serial(self, features):
+
+        # only new features are streamed, so each gets a new resourceid
+        tiles, resources = [], []
+        for feature in features:
+            res = FMSFResource.from_shp_feature(feature)
+            res.resource = None
+            res.resourceid = str(uuid.uuid4())
+            tiles += res.generate_tiles(self)
+            resources.append((res.siteid, res.resourceid))
+
+        return tiles, resources
+
+    def _generate_load_data_parallel(self, features, pool, workers):
+        """
+        Splits the features into smaller chunks that are processed by the pool
+        of worker processes. GDAL features can't be pickled, so each one is
+        first converted to a plain dict record of the fields that are used in
+        generate_tiles(), and sent along with its geometry and CSV rows. Each
+        worker holds its own importer, with its own node, nodegroup, and concept
+        lookups, and the resulting tile rows are merged here.
+        """
+
+        fields = self.get_feature_fields()
+        records = [feature_to_record(i, fields) for i in features]
+        chunk_size = math.ceil(len(records) / (workers * 4))
+        payloads = []
+        for i in range(0, len(records), chunk_size):
+            chunk = records[i : i + chunk_size]
+            siteids = [get_feature_siteid(r) for r in chunk]
+            geojson = {i: self.geojson_lookup.get(i) for i in siteids}
+            csv_data = {i: self.csv_data[i] for i in siteids if i in self.csv_data}
+            payloads.append((chunk, geojson, csv_data))
+
+        tiles, resources = [], []
+        for chunk_tiles, chunk_resources, label_misses in pool.imap_unordered(
+            _generate_tiles_for_records, payloads
+        ):
+            tiles += chunk_tiles
+            resources += chunk_resources
+            self.merge_label_misses(label_misses)
+
+        return tiles, resources
+
+    def get_feature_fields(self):
+        """Returns the names of all shapefile fields used by the field map."""
+
+        fields = ["SITEID"]
+        for fieldset in self.field_map.values():
+            for field in fieldset:
+                if field["source"] == "shp" and field["field"] != "geom":
+                    fields.append(field["field"])
+        return list(set(fields))
+
+    def write_data_to_load_staging(self, tiles, batch_size=None):
+        """
+        Writes the given tile rows to the load_staging table in batches, with a
+        single multi-row INSERT per batch. The running total is kept in
+        self.reporter.data["Tiles staged"].
+        """
+
+        if batch_size is None:
+            batch_size = settings.FMSF_STAGING_BATCH_SIZE
+
+        with connection.cursor() as cursor:
+            for start in range(0, len(tiles), batch_size):
+                batch = tiles[start : start + batch_size]
+                execute_values(
+                    cursor.cursor,
+                    """
+                    INSERT INTO load_staging (
+                        nodegroupid,
+                        legacyid,
+                        resourceid,
+                        tileid,
+                        parenttileid,
+                        value,
+                        loadid,
+                        nodegroup_depth,
+                        source_description,
+                        passes_validation,
+                        operation
+                    ) VALUES %s""",
+                    batch,
+                    template="(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,'insert')",
+                    page_size=batch_size,
+                )
+                self.reporter.data["Tiles staged"] += len(batch)
+                logger.debug(f"staged {self.reporter.data['Tiles staged']} tiles")
+
+    def check_load_staging(self):
+        """Runs the tile cardinality check against everything staged for this load."""
 
         self.reporter.stage = "staging data to load"
         self.update_status_and_load_details("validated")
 
-        logger.debug("writing data to load_staging table")
         try:
             with connection.cursor() as cursor:
-                for tile in self.tiles:
-                    cursor.execute(
-                        """
-                        INSERT INTO load_staging (
-                            nodegroupid,
-                            legacyid,
-                            resourceid,
-                            tileid,
-                            parenttileid,
-                            value,
-                            loadid,
-                            nodegroup_depth,
-                            source_description,
-                            passes_validation,
-                            operation
-                        ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,'insert')""",
-                        tile,
-                    )
-
                 cursor.execute(
                     """CALL __arches_check_tile_cardinality_violation_for_load(%s)""",
                     [self.loadid],
                 )
-            self.reporter.message = (
-                f"{len(self.tiles)} tiles written to load_staging table"
-            )
+            self.reporter.message = f"{self.reporter.data['Tiles staged']} tiles written to load_staging table"
         except Exception as e:
             self.reporter.success = False
             self.reporter.message = str(e)
@@ -803,13 +1072,18 @@ class FMSFImporter(BaseImportModule):
         self.update_status_and_load_details("validated")
 
         logger.debug("running spatial join on resources")
-        resids = [i.resourceid for i in self.fmsf_resources]
+        resids = [i[1] for i in self.loaded_resources]
         if self.graph and self.graph.name:
             try:
                 joiner = SpatialJoin(self.graph.name)
-                resources = ResourceInstance.objects.filter(pk__in=resids)
-                for resource in resources:
-                    joiner.update_resource(resource)
+                # all new resources are indexed in finalize_indexing()
+                with defer_mvt_invalidation():
+                    joiner.update_resources(resids, index=False)
+                # tiles are written from staging without signals, so the
+                # accessible resource sets are refreshed here once per batch
+                batch_size = settings.FMSF_INDEX_BATCH_SIZE
+                for start in range(0, len(resids), batch_size):
+                    refresh_accessible_resources(resids[start : start + batch_size])
             except Exception as e:
                 self.reporter.success = False
                 self.reporter.message = str(e)
@@ -820,20 +1094,34 @@ class FMSFImporter(BaseImportModule):
         self.reporter.log(logger)
         return
 
-    def finalize_indexing(self):
+    def finalize_indexing(self, dry_run=False):
 
         try:
             self.reporter.stage = "indexing resources"
             self.update_status_and_load_details("completed")
+            # a dry run writes no tiles, so there are no geometries to refresh
+            if not dry_run:
+                self.refresh_geometries()
+
+            # celery runs tasks in daemon processes, which can't start a pool
+            workers = settings.FMSF_INDEX_WORKERS
+            if workers > 1 and multiprocessing.current_process().daemon:
+                logger.debug("indexing in a single process from a daemon process")
+                workers = 1
             index_resources_by_transaction(
                 self.loadid,
+                batch_size=settings.FMSF_INDEX_BATCH_SIZE,
                 quiet=True,
-                use_multiprocessing=False,
+                use_multiprocessing=workers > 1,
+                max_subprocesses=workers,
                 recalculate_descriptors=True,
             )
             self.reporter.stage = "completed"
-            with connection.cursor() as cursor:
-                cursor.execute("REFRESH MATERIALIZED VIEW mv_geojson_geoms;")
+            if not dry_run:
+                if settings.FMSF_REFRESH_GEOMS_VIEW:
+                    self.refresh_geoms_view()
+                bump_mvt_generation()
+                queue_cluster_pyramid_refresh()
             with connection.cursor() as cursor:
                 cursor.execute(
                     """UPDATE load_event SET (status, indexed_time, complete, successful, load_details) = (%s, %s, %s, %s, %s) WHERE loadid = %s""",
@@ -854,6 +1142,38 @@ class FMSFImporter(BaseImportModule):
         self.reporter.log(logger)
         return
 
+    def refresh_geometries(self, batch_size=5000):
+        """
+        The spatial attributes trigger is disabled while tiles are written from
+        load_staging, so the geojson_geometries rows (used by the MVT layers)
+        are created here, for the geometry tiles of the new resources only.
+        """
+
+        resids = [i[1] for i in self.loaded_resources]
+        with connection.cursor() as cursor:
+            for start in range(0, len(resids), batch_size):
+                cursor.execute(
+                    """SELECT refresh_tile_geojson_geometries(t.tileid) FROM tiles t
+                    WHERE t.resourceinstanceid = ANY(%(resourceids)s::uuid[])
+                        AND t.nodegroupid IN (
+                            SELECT nodegroupid FROM nodes
+                            WHERE graphid = %(graphid)s
+                                AND datatype = 'geojson-feature-collection'
+                        );""",
+                    {
+                        "resourceids": resids[start : start + batch_size],
+                        "graphid": self.graph.pk,
+                    },
+                )
+        logger.debug(f"geometries refreshed for {len(resids)} resources")
+
+    def refresh_geoms_view(self):
+        """Refreshes mv_geojson_geoms without blocking reads of the view. This
+        uses the unique index added in hms migration 0028."""
+
+        with connection.cursor() as cursor:
+            cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_geojson_geoms;")
+
     @staticmethod
     def run_web_import(request):
 
@@ -864,6 +1184,8 @@ class FMSFImporter(BaseImportModule):
         description = request.POST.get("loadDescription")
         only_extra_ids = request.POST.get("onlySiteIdList")
         loadid = request.POST.get("loadId")
+        workers = request.POST.get("workers")
+        resume = request.POST.get("resume")
         if truncate == "0":
             truncate = None
         if dry_run == "true":
@@ -874,6 +1196,14 @@ class FMSFImporter(BaseImportModule):
             only_extra_ids = True
         else:
             only_extra_ids = False
+        if workers:
+            workers = int(workers)
+        else:
+            workers = None
+        if resume == "true":
+            resume = True
+        else:
+            resume = False
 
         run_fmsf_import_as_task.delay(  # pyright: ignore[reportFunctionMemberAccess]
             loadid,
@@ -882,6 +1212,8 @@ class FMSFImporter(BaseImportModule):
             dry_run=dry_run,
             description=description,
             only_extra_ids=only_extra_ids,
+            workers=workers,
+            resume=resume,
         )
 
         return {
@@ -896,6 +1228,9 @@ class FMSFImporter(BaseImportModule):
         resource_type = kwargs.get("resource_type", None)
         dry_run = kwargs.get("dry_run", False)
         truncate = kwargs.get("truncate")
+        workers = kwargs.get("workers")
+        resume = kwargs.get("resume", False)
+        loadid = kwargs.get("loadid")
 
         if resource_type is None:
             raise Exception("resource_type must be provided")
@@ -904,9 +1239,19 @@ class FMSFImporter(BaseImportModule):
         file_dir = kwargs.get("file_dir")
         if file_dir is None:
             raise Exception("file_dir must be provided")
+        if workers is not None:
+            workers = int(workers)
+        if resume and loadid is None:
+            raise Exception("loadid must be provided to resume a load")
 
         self.run_sequence(
-            resource_type, truncate=truncate, dry_run=dry_run, file_dir=file_dir
+            resource_type,
+            loadid=loadid,
+            truncate=truncate,
+            dry_run=dry_run,
+            file_dir=file_dir,
+            workers=workers,
+            resume=resume,
         )
 
         return self.reporter.serialize()
@@ -920,6 +1265,8 @@ class FMSFImporter(BaseImportModule):
         file_dir=None,
         description="",
         only_extra_ids=False,
+        workers=None,
+        resume=False,
     ):
 
         # the loadid may or may not be created already, but now it must be
@@ -956,52 +1303,78 @@ class FMSFImporter(BaseImportModule):
         # use the provided resource_type to reference the proper graph and import files
         self._set_resource_type(resource_type)
 
-        # START THE PROCESS
-        self.initialize_load_event(load_description=description)
+        # START THE PROCESS, or pick up a previous run of this load where it
+        # stopped. completed stages are skipped and their results are restored
+        # from load_details, load_staging, and the checkpoint files in file_dir.
+        if resume is True:
+            self.resume_load_event()
+        else:
+            self.initialize_load_event(load_description=description)
 
         # RUN FILE VALIDATION
         self.validate_files(file_dir)
         if self.reporter.success is False:
             return self.abort_load()
 
-        # create lookup of all existing resource instances for comparison
-        self._set_resource_lookup()
+        # the ids of the sites to load are only needed to generate the load data
+        if not self.stage_is_complete("generate") and not self.restore_siteids():
 
-        # READ FEATURES FROM THE INPUT SHAPEFILE
-        self.read_features_from_shapefile()
-        if len(self.new_features) == 0:
-            return self.abort_load(status="indexed")
+            # READ FEATURES FROM THE INPUT SHAPEFILE, after creating a lookup of
+            # all existing resource instances for comparison. the lookup is only
+            # used to find the new sites, so it has no checkpoint of its own and
+            # is always recomputed whenever this stage runs.
+            self._set_resource_lookup()
+            self.read_features_from_shapefile()
+            if len(self.new_siteids) == 0:
+                return self.abort_load(status="indexed")
+            self.write_siteids_checkpoint()
+            self.save_checkpoint("read")
 
         # RUN FILTERS ON THE STRUCTURES, IF NECESSARY
         if self.resource_type == "Historic Structure":
-            self.apply_historical_structures_filter(only_extra_ids=only_extra_ids)
+            if not self.stage_is_complete("filter"):
+                self.apply_historical_structures_filter(only_extra_ids=only_extra_ids)
+                if self.reporter.success is False:
+                    return self.abort_load()
+                self.write_siteids_checkpoint()
+                self.save_checkpoint("filter")
+
+        # GENERATE THE DATA TO BE LOADED AND WRITE IT TO THE STAGING TABLE
+        if self.stage_is_complete("generate"):
+            self.restore_loaded_resources()
+        else:
+            # clear anything staged by an earlier, incomplete run
+            self.clear_load_staging()
+            self.generate_load_data(truncate=truncate, workers=workers)
             if self.reporter.success is False:
                 return self.abort_load()
+            self.save_checkpoint("generate")
 
-        # GENERATE THE DATA TO BE LOADED
-        self.generate_load_data(truncate=truncate)
-        if self.reporter.success is False:
-            return self.abort_load()
-
-        # WRITE THE LOAD DATA TO THE STAGING TABLE IN ARCHES DB
-        self.write_data_to_load_staging()
-        if self.reporter.success is False:
-            return self.abort_load()
+        # CHECK THE DATA THAT WAS STREAMED TO THE STAGING TABLE IN ARCHES DB
+        if not self.stage_is_complete("check staging"):
+            self.check_load_staging()
+            if self.reporter.success is False:
+                return self.abort_load()
+            self.save_checkpoint("check staging")
 
         # RUN THE FUNCTION TO TRANSLATE THE STAGING TABLE INTO REAL TILES
         if dry_run is True:
-            self.reporter.message = f"Dry run completed successfully with {len(self.fmsf_resources)} resources."
-            self.finalize_indexing()
+            self.reporter.message = f"Dry run completed successfully with {len(self.loaded_resources)} resources."
+            self.finalize_indexing(dry_run=True)
             return self.reporter.serialize()
 
-        self.write_tiles_from_load_staging()
-        if self.reporter.success is False:
-            return self.abort_load()
+        if not self.stage_is_complete("write tiles"):
+            self.write_tiles_from_load_staging()
+            if self.reporter.success is False:
+                return self.abort_load()
+            self.save_checkpoint("write tiles")
 
         # RUN SPATIAL JOIN ON ALL NEW RESOURCES
-        self.run_spatial_join()
-        if self.reporter.success is False:
-            return self.abort_load()
+        if not self.stage_is_complete("spatial join"):
+            self.run_spatial_join()
+            if self.reporter.success is False:
+                return self.abort_load()
+            self.save_checkpoint("spatial join")
 
         # write the cumulative reporter data to load_details in the final step
         self.finalize_indexing()
@@ -1010,6 +1383,114 @@ class FMSFImporter(BaseImportModule):
 
         self.reporter.message = "completed without error"
 
+    def resume_load_event(self):
+        """
+        Reopens the load_event of an earlier run of this load, and restores the
+        reporter data from its load_details, including the list of stages that
+        were completed.
+        """
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """SELECT load_details FROM load_event WHERE loadid = %s""",
+                [self.loadid],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            raise Exception(f"no load_event to resume for loadid: {self.loadid}")
+
+        details = row[0] if isinstance(row[0], dict) else json.loads(row[0] or "{}")
+        details.pop("Message", None)
+        details.pop("Stage", None)
+        self.reporter.data.update(details)
+        self.reporter.data.setdefault(CHECKPOINT_KEY, [])
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """UPDATE load_event SET (status, error_message, complete, successful, load_details) = (%s, %s, %s, %s, %s) WHERE loadid = %s""",
+                (
+                    "running",
+                    None,
+                    False,
+                    False,
+                    self.reporter.get_load_details(),
+                    self.loadid,
+                ),
+            )
+        self.reporter.message = f"resuming etl with loadid: {self.loadid}, completed stages: {self.reporter.data[CHECKPOINT_KEY]}"
+        self.reporter.log(logger)
+
+    def stage_is_complete(self, stage):
+        return stage in self.reporter.data.get(CHECKPOINT_KEY, [])
+
+    def save_checkpoint(self, stage):
+        """Records a completed stage in load_details, so that it is skipped if
+        this load is resumed."""
+
+        completed = self.reporter.data.setdefault(CHECKPOINT_KEY, [])
+        if stage not in completed:
+            completed.append(stage)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """UPDATE load_event SET load_details = %s WHERE loadid = %s""",
+                (self.reporter.get_load_details(), self.loadid),
+            )
+
+    def write_siteids_checkpoint(self):
+
+        try:
+            with open(Path(self.file_dir, SITEIDS_CHECKPOINT_FILE), "w") as o:
+                json.dump(sorted(self.new_siteids), o)
+        except OSError as e:
+            # without this file the shapefile is read again on resume
+            logger.warning(f"unable to write site id checkpoint: {e}")
+
+    def restore_siteids(self):
+        """Loads the ids of the sites to import from the checkpoint file, if the
+        read stage was completed. Returns False if the shapefile must be read
+        (and filtered) again."""
+
+        if not self.stage_is_complete("read"):
+            return False
+        try:
+            with open(Path(self.file_dir, SITEIDS_CHECKPOINT_FILE), "r") as o:
+                self.new_siteids = set(json.load(o))
+        except (OSError, ValueError) as e:
+            logger.warning(f"unable to read site id checkpoint: {e}")
+            completed = self.reporter.data[CHECKPOINT_KEY]
+            completed[:] = [i for i in completed if i not in ["read", "filter"]]
+            return False
+        return True
+
+    def clear_load_staging(self):
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """DELETE FROM load_staging WHERE loadid = %s""", [self.loadid]
+            )
+
+    def restore_loaded_resources(self):
+        """Rebuilds the (siteid, resourceid) list of new resources from the rows
+        that were written to load_staging by generate_load_data(), or, if those
+        are gone, from the resources already created by this load."""
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """SELECT DISTINCT legacyid, resourceid FROM load_staging WHERE loadid = %s""",
+                [self.loadid],
+            )
+            rows = cursor.fetchall()
+            if len(rows) == 0 and self.stage_is_complete("write tiles"):
+                cursor.execute(
+                    """SELECT ri.legacyid, ri.resourceinstanceid FROM resource_instances ri
+                    WHERE ri.resourceinstanceid IN (
+                        SELECT resourceinstanceid::uuid FROM edit_log WHERE transactionid = %s
+                    );""",
+                    [self.loadid],
+                )
+                rows = cursor.fetchall()
+        self.loaded_resources = [(i[0], str(i[1])) for i in rows]
+
     def update_status_and_load_details(self, status):
         """
         Sets the load_event status as specified and updates the load_details
@@ -1076,3 +1557,56 @@ class FMSFImporter(BaseImportModule):
             nodegroup = NodeGroup.objects.get(pk=nodegroupid)
             self.nodegroup_lookup[nodegroupid] = nodegroup
         return nodegroup
+
+
+def feature_to_wkb(feature) -> Binary:
+    """Returns the geometry of a GDAL feature as WKB, wrapped for use as a bytea
+    query parameter."""
+
+    return Binary(bytes(feature.geom.wkb))
+
+
+def feature_to_record(feature, fields) -> dict:
+    """Converts a GDAL feature into a picklable dict of the given fields."""
+
+    return {field: feature.get(field) for field in fields}
+
+
+## these module-level functions are used by the worker processes in
+## FMSFImporter._generate_load_data_parallel(). Each worker builds a single
+## importer when it starts, and reuses it (and its lookups) for every chunk.
+## The CSV is only read by the parent, which sends the rows for each chunk.
+
+_worker_importer = None
+
+
+def _init_tile_worker(resource_type, loadid, file_dir):
+    global _worker_importer
+
+    importer = FMSFImporter()
+    importer.loadid = loadid
+    importer.file_dir = Path(file_dir)
+    importer._set_resource_type(resource_type)
+    _worker_importer = importer
+
+
+def _generate_tiles_for_records(payload):
+
+    records, geojson_lookup, csv_data = payload
+    importer = _worker_importer
+    if importer is None:
+        raise Exception("tile worker has not been initialized")
+    importer.geojson_lookup = geojson_lookup
+    importer.csv_data = csv_data
+    importer.label_misses = {}
+
+    # only new features are passed to the workers, so each gets a new resourceid
+    tiles, resources = [], []
+    for record in records:
+        res = FMSFResource.from_shp_feature(record)
+        res.resource = None
+        res.resourceid = str(uuid.uuid4())
+        tiles += res.generate_tiles(importer)
+        resources.append((res.siteid, res.resourceid))
+
+    return tiles, resources, importer.label_misses
@@ -15,7 +15,6 @@ from arches.app.etl_modules.base_import_module import BaseImportModule
 from arches.app.models.models import (
     Node,
     ETLModule,
-    ResourceInstance,
 )
 from arches.app.models.resource import Resource
 from arches.app.models.system_settings import settings
@@ -27,8 +26,16 @@ from hms.models import (
     ManagementAreaCategory,
     ManagementAgency,
 )
-from fpan.tasks import run_management_area_import_as_task
-from fpan.utils import ETLOperationResult, SpatialJoin
+from fpan.tasks import (
+    queue_cluster_pyramid_refresh,
+    run_management_area_import_as_task,
+)
+from fpan.utils import (
+    ETLOperationResult,
+    defer_management_area_join,
+    defer_mvt_invalidation,
+    join_management_area_changes,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -246,7 +253,8 @@ class ManagementAreaImporter(BaseImportModule):
         name_field = [i for i in lyr.fields if i.lower() == "name"][0]
         logger.debug("name field: " + name_field)
         try:
-            with transaction.atomic():
+            # the new areas are joined all at once in apply_spatial_join()
+            with transaction.atomic(), defer_management_area_join():
                 for feature in lyr:
                     logger.debug(feature)
                     geom = GEOSGeometry(feature.geom.wkt)
@@ -290,23 +298,21 @@ class ManagementAreaImporter(BaseImportModule):
         self.reporter.stage = "running spatial join"
         self.update_status_and_load_details("validated")
 
-        all_resids = []
-        for area in self.areas:
-            self.reporter.stage = f"processing {area.name}"
-            self.update_status_and_load_details("validated")
-            resids = area.get_intersecting_resource_ids()
-            resourceinstances = ResourceInstance.objects.filter(pk__in=resids).exclude(
-                graph_id=settings.SYSTEM_SETTINGS_RESOURCE_MODEL_ID
-            )
-            for res in resourceinstances:
-                if res.graph and res.graph.name:
-                    joiner = SpatialJoin(res.graph.name)
-                    joiner.update_resource(res, index=False)
-                else:
-                    logger.warning(f"no graph on this resource instance: {res.pk}")
-            all_resids += resids
+        # only the new areas are joined, with one joiner for each graph
+        try:
+            with defer_mvt_invalidation():
+                all_resids = join_management_area_changes(
+                    added=[i.pk for i in self.areas], index=False
+                )
+        except Exception as e:
+            self.reporter.success = False
+            self.reporter.message = str(e)
+            return
+        self.reporter.data["Resources updated"] = len(all_resids)
+
         resources = Resource.objects.filter(pk__in=all_resids)
         index_resources_using_singleprocessing(resources, quiet=True)
+        queue_cluster_pyramid_refresh()
 
     def finalize_load(self):
 
@@ -435,9 +441,9 @@ class ManagementAreaImporter(BaseImportModule):
             data={
                 "Load ID": self.loadid,
                 "Management Area Group": self.group.name if self.group else "---",
-                "Management Area Category": self.category.name
-                if self.category
-                else "---",
+                "Management Area Category": (
+                    self.category.name if self.category else "---"
+                ),
                 "Management Agency": self.agency.name if self.agency else "---",
                 "Management Area Level": self.level,
             },
@@ -1,12 +1,21 @@
+import time
 from datetime import datetime
+
+import billiard
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connections
 from arches.app.models.models import ResourceInstance
 from arches.app.models.graph import Graph
 from arches.app.models.tile import Tile
-from arches.app.utils.index_database import index_resources_by_type
+from arches.app.utils.index_database import (
+    index_resources_using_multiprocessing,
+    index_resources_using_singleprocessing,
+)
+from arches.app.models.resource import Resource
 
-from fpan.utils import SpatialJoin
+from fpan.tasks import queue_cluster_pyramid_refresh
+from fpan.utils import SpatialJoin, bump_mvt_generation, defer_mvt_invalidation
 
 
 class Command(BaseCommand):
@@ -37,6 +46,18 @@ class Command(BaseCommand):
             "--noinput",
             action="store_true",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of worker processes to shard the resources across.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of resources handled by a worker at a time.",
+        )
 
     def handle(self, *args, **options):
 
@@ -48,14 +69,22 @@ class Command(BaseCommand):
             joiner = SpatialJoin(resource.graph.name)
             joiner.update_resource(resource)
         elif graph_name := options["graph"]:
-            self.run_join_by_graph(graph_name)
+            self.run_join_by_graph(
+                graph_name, workers=options["workers"], chunk_size=options["chunk_size"]
+            )
+            queue_cluster_pyramid_refresh()
         elif options["all"]:
             for graph_name in [
                 "Archaeological Site",
                 "Historic Cemetery",
                 "Historic Structure",
             ]:
-                self.run_join_by_graph(graph_name)
+                self.run_join_by_graph(
+                    graph_name,
+                    workers=options["workers"],
+                    chunk_size=options["chunk_size"],
+                )
+            queue_cluster_pyramid_refresh()
         elif options["backfill"]:
             # find all empty FPAN Region nodes and use only these resources
             resids = []
@@ -96,13 +125,87 @@ class Command(BaseCommand):
 
         print(f"completed. elapsed time: {datetime.now() - start}")
 
-    def run_join_by_graph(self, graph_name):
+    def run_join_by_graph(self, graph_name, workers=1, chunk_size=1000):
         graph = Graph.objects.get(name=graph_name)
-        resources = ResourceInstance.objects.filter(graph=graph)
-        joiner = SpatialJoin(graph_name)
-        total = resources.count()
-        for n, res in enumerate(resources, start=1):
-            print(f"{n}/{total}: {str(res.pk)} ({res.graph.name})")
-            joiner.update_resource(res, index=False)
-        graph = Graph.objects.get(name=graph_name)
-        index_resources_by_type([str(graph.pk)])
+        resourceids = [
+            str(i)
+            for i in ResourceInstance.objects.filter(graph=graph).values_list(
+                "pk", flat=True
+            )
+        ]
+        total = len(resourceids)
+        chunks = [resourceids[i : i + chunk_size] for i in range(0, total, chunk_size)]
+        print(f"{graph_name}: {total} resources, {len(chunks)} chunks")
+
+        start = time.time()
+        changed = []
+
+        def print_progress(done):
+            elapsed = time.time() - start
+            rate = round(done / elapsed, 1) if elapsed else 0
+            print(f"{done}/{total} resources joined ({rate} resources/sec)")
+
+        done = 0
+        if workers > 1:
+            # forked workers must not share the parent's database connection
+            connections.close_all()
+            pool = billiard.Pool(
+                workers, initializer=_init_join_worker, initargs=(graph_name,)
+            )
+            try:
+                for chunk_ct, chunk_changed in pool.imap_unordered(
+                    _join_resources, chunks
+                ):
+                    done += chunk_ct
+                    changed += chunk_changed
+                    print_progress(done)
+            finally:
+                pool.close()
+                pool.join()
+                # the workers leave the cached MVT tiles alone
+                bump_mvt_generation()
+        else:
+            joiner = SpatialJoin(graph_name)
+            with defer_mvt_invalidation():
+                for chunk in chunks:
+                    changed += joiner.update_resources(
+                        chunk, index=False, chunk_size=chunk_size
+                    )
+                    done += len(chunk)
+                    print_progress(done)
+
+        print(f"{len(changed)} resources changed, reindexing")
+        if len(changed) == 0:
+            return
+        if workers > 1:
+            index_resources_using_multiprocessing(
+                changed, batch_size=chunk_size, quiet=True, max_subprocesses=workers
+            )
+        else:
+            index_resources_using_singleprocessing(
+                Resource.objects.filter(pk__in=changed), quiet=True
+            )
+
+
+## these module-level functions are used by the worker processes in
+## Command.run_join_by_graph(). Each worker opens its own database connection
+## and builds a single SpatialJoin when it starts.
+
+_worker_joiner = None
+
+
+def _init_join_worker(graph_name):
+    global _worker_joiner
+
+    _worker_joiner = SpatialJoin(graph_name)
+
+
+def _join_resources(resourceids):
+
+    if _worker_joiner is None:
+        raise Exception("join worker has not been initialized")
+    with defer_mvt_invalidation(bump=False):
+        changed = _worker_joiner.update_resources(
+            resourceids, index=False, chunk_size=len(resourceids)
+        )
+    return len(resourceids), changed
@@ -1,4 +1,5 @@
 import json
+import hashlib
 import logging
 from pathlib import Path
 
@@ -69,12 +70,20 @@ class Rule(object):
             if not isinstance(value, list):
                 value = [value]
 
+            self.config["node_id"] = str(node.pk)
             self.config["node_name"] = node.name
             if node.nodegroup is None:
                 raise (Exception(f"node error: No nodegroup on this node '{node_id}'"))
             self.config["nodegroup_id"] = str(node.nodegroup.pk)
             self.config["value"] = value
 
+            # rules on management areas or agencies also hold their ids, so they
+            # can be evaluated against ids rather than display names
+            if "area_ids" in kwargs:
+                self.config["area_ids"] = [int(i) for i in kwargs["area_ids"]]
+            if "agency_codes" in kwargs:
+                self.config["agency_codes"] = [str(i) for i in kwargs["agency_codes"]]
+
         elif self.type == "resourceid_filter":
             self.config["resourceids"] = kwargs.get("resourceids", [])
 
@@ -94,6 +103,15 @@ class Rule(object):
             "config": self.config,
         }
 
+    @property
+    def signature(self) -> str:
+        """A stable hash of this rule's type and config. Users whose rules are
+        identical share the same signature, so it is used to key anything that
+        is derived from a rule."""
+
+        content = json.dumps(self.serialize(), sort_keys=True, default=str)
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
 
 class RuleFilter(BaseSearchFilter):
     def append_dsl(self, search_query_object, **kwargs):
@@ -235,6 +253,9 @@ class RuleFilter(BaseSearchFilter):
 
     def get_attribute_filter_clause(self, rule_config):
 
+        if "area_ids" in rule_config or "agency_codes" in rule_config:
+            return self.get_management_filter_clause(rule_config)
+
         attribute_bool = Bool()
         terms = Terms(field="strings.nodegroup_id", terms=[rule_config["nodegroup_id"]])
         attribute_bool.filter(terms)
@@ -244,6 +265,29 @@ class RuleFilter(BaseSearchFilter):
 
         return Nested(path="strings", query=attribute_bool)
 
+    def get_management_filter_clause(self, rule_config):
+        """Matches the concept value ids of the rule's management areas or
+        agency, rather than their display names, as keyword terms."""
+
+        from hms.models import ManagementArea, ManagementAgency, get_concept_value_ids
+
+        if "area_ids" in rule_config:
+            objects = ManagementArea.objects.filter(pk__in=rule_config["area_ids"])
+        else:
+            objects = ManagementAgency.objects.filter(
+                code__in=rule_config["agency_codes"]
+            )
+        concept_ids = objects.values_list("concept_id", flat=True)
+        valueids = list(get_concept_value_ids(concept_ids).values())
+
+        domains_bool = Bool()
+        domains_bool.filter(
+            Terms(field="domains.nodegroup_id", terms=[rule_config["nodegroup_id"]])
+        )
+        domains_bool.filter(Terms(field="domains.valueid", terms=valueids))
+
+        return Nested(path="domains", query=domains_bool)
+
     def apply_rule(self, rule):
 
         if rule.type == "full_access":
@@ -340,8 +384,11 @@ class RuleFilter(BaseSearchFilter):
         """
         Returns a list of resources for single graph_filter rule. This
         can be used in other parts of the app, like MVT() or decorators.
-        Note the 10000 item limit. If you are trying to get a list of resource
-        ids larger than 10000 you may need to rethink this strategy.
+
+        attribute_filter and resourceid_filter rules are resolved through the
+        materialized set of accessible resource ids for the rule (see
+        hms.permissions_backend.get_accessible_resourceids), so there is no
+        limit to the number of ids that are returned.
 
         Use ids_only=True to get a flat list of ids, otherwise each item in
         the returned list is a small dictionary with 'resourceid', 'graph_id'
@@ -354,6 +401,14 @@ class RuleFilter(BaseSearchFilter):
         if rule.type in ["full_access", "no_access"]:
             return list()
 
+        if rule.type in ["attribute_filter", "resourceid_filter"]:
+            from hms.permissions_backend import get_accessible_resourceids
+
+            resourceids = sorted(get_accessible_resourceids(rule))
+            if ids_only is True:
+                return resourceids
+            return self.get_resource_details(resourceids)
+
         self.apply_rule(rule)
 
         se = SearchEngineFactory().create()
@@ -369,3 +424,47 @@ class RuleFilter(BaseSearchFilter):
             return [i["_source"]["resourceinstanceid"] for i in results["hits"]["hits"]]
 
         return [i["_source"] for i in results["hits"]["hits"]]
+
+    def resource_matches_rule(self, rule, resourceid) -> bool:
+        """
+        Tests a single resource against a rule with one query that combines the
+        rule clause and a filter on the resource's id.
+        """
+
+        self.paramount = Bool()
+        self.existing_query = False
+
+        if rule.type in ["full_access", "no_access"]:
+            return rule.type == "full_access"
+
+        self.apply_rule(rule)
+        self.paramount.filter(Terms(field="resourceinstanceid", terms=[resourceid]))
+
+        se = SearchEngineFactory().create()
+        query = Query(se, start=0, limit=1)
+        query.include("resourceinstanceid")
+        query.add_query(self.paramount)
+        results = query.search(index="resources")
+
+        return len(results["hits"]["hits"]) > 0
+
+    def get_resource_details(self, resourceids, chunk_size=10000):
+        """
+        Returns the 'resourceid', 'graph_id' and 'displayname' for each of the
+        provided resource ids, querying the index in chunks to stay under the
+        Elasticsearch result window.
+        """
+
+        se = SearchEngineFactory().create()
+        details = []
+        for i in range(0, len(resourceids), chunk_size):
+            chunk = resourceids[i : i + chunk_size]
+            query = Query(se, start=0, limit=len(chunk))
+            query.include("graph_id")
+            query.include("resourceinstanceid")
+            query.include("displayname")
+            query.add_query(self.get_resourceid_filter_clause(chunk))
+            results = query.search(index="resources")
+            details += [i["_source"] for i in results["hits"]["hits"]]
+
+        return details
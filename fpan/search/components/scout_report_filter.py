@@ -7,8 +7,6 @@ from arches.app.search.search_engine_factory import SearchEngineFactory
 from arches.app.search.elasticsearch_dsl_builder import Bool, Terms, Query
 from arches.app.search.components.base import BaseSearchFilter
 from arches.app.search.mappings import RESOURCES_INDEX
-from arches.app.models.models import Node
-from arches.app.models.tile import Tile
 
 from fpan.search.components.rule_filter import save_dsl
 
@@ -60,24 +58,14 @@ class ScoutReportFilter(BaseSearchFilter):
                 i["_source"]["resourceinstanceid"] for i in results["hits"]["hits"]
             ]
 
-            # now look through all Scout Report tiles to return ids of the ones that reference
-            # the resource ids returned from the original query
-            site_node = Node.objects.get(
-                name="FMSF Site ID", graph_id=settings.GRAPH_LOOKUP["sr"]["id"]
+            # now use the site -> report index to get the ids of reports that
+            # reference the resource ids returned from the original query
+            from hms.models import ScoutReportSite
+
+            reportids = ScoutReportSite.objects.filter(siteid__in=resids).values_list(
+                "reportid", flat=True
             )
-            report_siteid_tiles = Tile.objects.filter(
-                resourceinstance__graph_id=settings.GRAPH_LOOKUP["sr"]["id"],
-                nodegroup=site_node.nodegroup,
-                data__has_key=str(site_node.pk),
-            ).values_list("resourceinstance_id", "data")
-
-            reportids_set = set()
-            for t in report_siteid_tiles:
-                try:
-                    if t[1][str(site_node.pk)][0]["resourceId"] in resids:
-                        reportids_set.add(str(t[0]))
-                except IndexError as e:
-                    logger.warning(e)
+            reportids_set = set([str(i) for i in reportids])
 
             new_bool = Bool()
             terms = Terms(field="resourceinstanceid", terms=list(reportids_set))
@@ -215,6 +215,62 @@ GRAPH_LOOKUP = {
     "sr": {"id": "14578901-bd5d-11e9-822a-94659cf754d0", "name": "Scout Report"},
 }
 
+## number of seconds a user's compiled access rule is held in the cache. Entries
+## are also cleared by signals when profiles or management areas change.
+RULE_CACHE_TIMEOUT = 60 * 60
+
+## accessible resource sets that no access rule has used within this many seconds
+## are deleted, e.g. the sets of rules that changed with a user's areas
+ACCESSIBLE_RESOURCE_SET_MAX_AGE = 60 * 60 * 24 * 30
+
+## number of tiles written per INSERT statement while the FMSF importer
+## fills the load_staging table
+FMSF_STAGING_BATCH_SIZE = 5000
+
+## number of feature geometries sent to PostGIS per query while the FMSF
+## importer repairs geometries before generating tiles
+FMSF_GEOMETRY_BATCH_SIZE = 2000
+
+## set higher than 1 to generate FMSF import tiles in a pool of worker processes
+FMSF_IMPORT_WORKERS = 1
+
+## number of shapefile features read, transformed, and staged at a time by the
+## FMSF importer. This bounds the importer's memory use on large exports.
+FMSF_IMPORT_CHUNK_SIZE = 10000
+
+## processes and Elasticsearch bulk batch size used to index the resources
+## created by an FMSF import. Set workers to 1 to index in a single process.
+FMSF_INDEX_WORKERS = 4
+FMSF_INDEX_BATCH_SIZE = 2000
+
+## refresh the mv_geojson_geoms materialized view after an FMSF import. The
+## refresh is concurrent, so the view can still be read while it runs.
+FMSF_REFRESH_GEOMS_VIEW = True
+
+## alias in CACHES used to store MVT resource layer tiles. To keep tiles out of
+## the default cache, add e.g. a FileBasedCache or RedisCache entry to CACHES
+## and set its alias here.
+MVT_CACHE_ALIAS = "default"
+
+## highest zoom level at which MVT tiles are cached
+MVT_CACHE_MAX_ZOOM = 20
+
+## highest zoom that cluster pyramids are precomputed for. Clustered tiles above
+## this (up to the node's clusterMaxZoom) are built live and cached.
+CLUSTER_PYRAMID_MAX_ZOOM = 8
+
+## cluster pyramids are only precomputed for rules whose clustered tiles were
+## requested within this many seconds
+CLUSTER_PYRAMID_RECENT_USE = 60 * 60 * 24 * 7
+
+## most z/x/y tiles invalidated at a single zoom when a resource changes. Larger
+## changes invalidate every cached tile instead.
+MVT_INVALIDATION_MAX_TILES = 256
+
+## seconds to wait after a geometry edit before the queued spatial join runs.
+## further edits within this window are joined in the same batch.
+SPATIAL_JOIN_DEBOUNCE = 10
+
 
 try:
     from .settings_local import *
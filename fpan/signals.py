@@ -1,22 +1,231 @@
 import logging
 
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete
 from django.dispatch import receiver
 
+from arches.app.models.models import Relation, Value
 from arches.app.models.tile import Tile
 
+from hms.models import ManagementArea
+
 logger = logging.getLogger(__name__)
 
 
 @receiver(post_save, sender=Tile)
 def join_management_areas_to_resourceinstance(sender, instance, created, **kwargs):
-    from .utils import SpatialJoin
+    """The join itself runs in a celery task, so that saving a geometry does not
+    wait on it (see fpan.tasks.queue_spatial_join)."""
+    from .tasks import queue_spatial_join
 
     if instance.nodegroup_id in settings.SPATIAL_COORDINATES_NODEGROUPS_IDS:
-        logger.debug(f"run spatial join on resource: {instance.resourceinstance_id}")
+        logger.debug(f"queue spatial join on resource: {instance.resourceinstance_id}")
         try:
-            joiner = SpatialJoin(instance.resourceinstance.graph.name)
-            joiner.update_resource(instance.resourceinstance)
+            queue_spatial_join(instance.resourceinstance)
         except Exception as e:
             logger.error(f"error encoutered during spatial join: {e}")
+
+
+@receiver(post_save, sender=Tile)
+@receiver(post_delete, sender=Tile)
+def update_resource_management_projection(sender, instance, **kwargs):
+    """Mirrors the areas and agencies in a management tile to the projection
+    tables that AREA and AGENCY rules are evaluated against. This must run
+    before the accessible resource sets are refreshed below."""
+    from hms.permissions_backend import accessible_resource_refresh_is_deferred
+    from .utils import update_management_projection
+
+    if accessible_resource_refresh_is_deferred():
+        return
+    nodegroupid = str(instance.nodegroup_id)
+    for graph in settings.GRAPH_LOOKUP.values():
+        if graph.get("spatial_node_lookup", {}).get("nodegroupid") == nodegroupid:
+            break
+    else:
+        return
+    try:
+        update_management_projection(
+            [instance.resourceinstance_id], nodegroupid=nodegroupid
+        )
+    except Exception as e:
+        logger.error(f"error encountered updating management projection: {e}")
+
+
+@receiver(post_save, sender=Tile)
+@receiver(post_delete, sender=Tile)
+def refresh_accessible_resource_sets(sender, instance, **kwargs):
+    """Keeps the materialized access rule sets current when a tile that a rule
+    depends on (management areas written by the spatial join, scout assignments)
+    is created, edited, or removed. Bulk jobs defer this and refresh once per
+    batch (see SpatialJoin)."""
+    from hms.permissions_backend import (
+        accessible_resource_refresh_is_deferred,
+        get_resource_set_nodegroupids,
+        refresh_accessible_resources,
+    )
+
+    if accessible_resource_refresh_is_deferred():
+        return
+    try:
+        if str(instance.nodegroup_id) not in get_resource_set_nodegroupids():
+            return
+        refresh_accessible_resources(
+            [instance.resourceinstance_id], nodegroupids=[instance.nodegroup_id]
+        )
+    except Exception as e:
+        logger.error(f"error encountered refreshing accessible resources: {e}")
+
+
+@receiver(post_save, sender=Tile)
+def index_scout_report_site(sender, instance, **kwargs):
+    from hms.permissions_backend import update_scout_report_site_index
+
+    try:
+        update_scout_report_site_index(instance)
+    except Exception as e:
+        logger.error(f"error encountered updating scout report index: {e}")
+
+
+@receiver(post_delete, sender=Tile)
+def remove_scout_report_site(sender, instance, **kwargs):
+    from hms.permissions_backend import update_scout_report_site_index
+
+    try:
+        update_scout_report_site_index(instance, deleted=True)
+    except Exception as e:
+        logger.error(f"error encountered updating scout report index: {e}")
+
+
+@receiver(post_save, sender=Value)
+@receiver(post_delete, sender=Value)
+@receiver(post_save, sender=Relation)
+@receiver(post_delete, sender=Relation)
+def invalidate_rdm_caches(sender, instance, **kwargs):
+    """Any change to a concept label or collection membership invalidates the
+    cached label indexes used by the FMSF importer."""
+    from .utils import bump_rdm_cache_version
+
+    try:
+        bump_rdm_cache_version()
+    except Exception as e:
+        logger.error(f"error encountered invalidating rdm caches: {e}")
+
+
+def _tile_affects_mvt(instance):
+
+    nodegroupid = str(instance.nodegroup_id)
+    if nodegroupid in settings.SPATIAL_COORDINATES_NODEGROUPS_IDS:
+        return True
+    for graph in settings.GRAPH_LOOKUP.values():
+        if graph.get("spatial_node_lookup", {}).get("nodegroupid") == nodegroupid:
+            return True
+
+    from hms.permissions_backend import get_resource_set_nodegroupids
+
+    return nodegroupid in get_resource_set_nodegroupids()
+
+
+@receiver(pre_save, sender=Tile)
+@receiver(pre_delete, sender=Tile)
+def capture_mvt_bbox(sender, instance, **kwargs):
+    """Holds the resource's bbox from before a geometry change, so that the
+    tiles covering its old location are invalidated too."""
+    from .utils import get_resources_bbox, mvt_invalidation_is_deferred
+
+    if mvt_invalidation_is_deferred():
+        return
+    if str(instance.nodegroup_id) not in settings.SPATIAL_COORDINATES_NODEGROUPS_IDS:
+        return
+    try:
+        instance._mvt_old_bbox = get_resources_bbox([instance.resourceinstance_id])
+    except Exception as e:
+        logger.error(f"error encountered reading resource bbox: {e}")
+
+
+@receiver(post_save, sender=Tile)
+@receiver(post_delete, sender=Tile)
+def invalidate_mvt_tiles_for_tile(sender, instance, **kwargs):
+    """Invalidates the cached MVT tiles around a resource when its geometry, its
+    management areas, or any other data that access rules depend on change."""
+    from .utils import (
+        invalidate_mvt_tiles,
+        invalidate_mvt_tiles_for_resources,
+        mvt_invalidation_is_deferred,
+    )
+
+    if mvt_invalidation_is_deferred():
+        return
+    try:
+        if not _tile_affects_mvt(instance):
+            return
+        invalidate_mvt_tiles(getattr(instance, "_mvt_old_bbox", None))
+        invalidate_mvt_tiles_for_resources([instance.resourceinstance_id])
+    except Exception as e:
+        logger.error(f"error encountered invalidating mvt tiles: {e}")
+
+
+@receiver(pre_save, sender=ManagementArea)
+@receiver(pre_delete, sender=ManagementArea)
+def capture_management_area_snapshot(sender, instance, **kwargs):
+    """Holds an area's geometry and values from before it is edited or deleted,
+    so that the resources it used to cover are joined again afterward."""
+    from .utils import get_management_area_snapshots, management_area_join_is_deferred
+
+    if kwargs.get("raw") or instance.pk is None or management_area_join_is_deferred():
+        return
+    try:
+        snapshots = get_management_area_snapshots([instance.pk])
+        instance._join_snapshot = snapshots.get(instance.pk)
+    except Exception as e:
+        logger.error(f"error encountered reading management area snapshot: {e}")
+
+
+def _on_commit_join(**kwargs):
+
+    from .tasks import queue_management_area_join
+
+    def _join():
+        try:
+            queue_management_area_join(**kwargs)
+        except Exception as e:
+            logger.error(f"error encountered joining management area changes: {e}")
+
+    transaction.on_commit(_join)
+
+
+@receiver(post_save, sender=ManagementArea)
+def join_saved_management_area(sender, instance, created, **kwargs):
+    """Joins a new area to the resources it covers, or re-joins the resources
+    under an edited area's old and new geometry. An area only gets its concept
+    on its second save (see ManagementArea.save()), so there is nothing to join
+    before then."""
+    from .utils import get_management_area_snapshots, management_area_join_is_deferred
+
+    if kwargs.get("raw") or management_area_join_is_deferred():
+        return
+    snapshot = getattr(instance, "_join_snapshot", None)
+    instance._join_snapshot = None
+    if instance.concept_id is None:
+        return
+    try:
+        if snapshot is None:
+            _on_commit_join(added=[instance.pk])
+        elif snapshot != get_management_area_snapshots([instance.pk]).get(instance.pk):
+            _on_commit_join(changed={instance.pk: snapshot})
+    except Exception as e:
+        logger.error(f"error encountered joining management area changes: {e}")
+
+
+@receiver(post_delete, sender=ManagementArea)
+def join_deleted_management_area(sender, instance, **kwargs):
+    """Removes a deleted area from the resources it covered."""
+
+    snapshot = getattr(instance, "_join_snapshot", None)
+    instance._join_snapshot = None
+    if snapshot is None:
+        return
+    try:
+        _on_commit_join(removed={instance.pk: snapshot})
+    except Exception as e:
+        logger.error(f"error encountered joining management area changes: {e}")
@@ -4,6 +4,22 @@ from celery import shared_task
 
 logger = logging.getLogger(__name__)
 
+SPATIAL_JOIN_SCHEDULED_KEY = "fpan_spatial_join_scheduled"
+
+
+def celery_is_available():
+    """Checking for a worker means pinging the broker, which is too slow for
+    every tile save, so the result is cached for a minute."""
+
+    from django.core.cache import cache
+    from arches.app.utils.task_management import check_if_celery_available
+
+    available = cache.get("fpan_celery_available")
+    if available is None:
+        available = check_if_celery_available()
+        cache.set("fpan_celery_available", available, 60)
+    return available
+
 
 @shared_task
 def run_fmsf_import_as_task(
@@ -13,6 +29,8 @@ def run_fmsf_import_as_task(
     dry_run=False,
     description="",
     only_extra_ids=False,
+    workers=None,
+    resume=False,
 ):
     from fpan.etl_modules.fmsf_importer import FMSFImporter
 
@@ -23,6 +41,8 @@ def run_fmsf_import_as_task(
         dry_run=dry_run,
         description=description,
         only_extra_ids=only_extra_ids,
+        workers=workers,
+        resume=resume,
     )
 
 
@@ -49,15 +69,130 @@ def run_management_area_import_as_task(
 
 @shared_task
 def run_full_spatial_join():
-    from arches.app.models.models import ResourceInstance
+    from fpan.utils import SpatialJoin, defer_mvt_invalidation
+
+    with defer_mvt_invalidation():
+        for graph_name in [
+            "Archaeological Site",
+            "Historic Cemetery",
+            "Historic Structure",
+        ]:
+            logger.debug(f"spatial join graph: {graph_name}")
+            joiner = SpatialJoin(graph_name)
+            joiner.update_graph()
+
+    queue_cluster_pyramid_refresh()
+
+
+@shared_task
+def refresh_cluster_pyramids():
+    from fpan.utils import build_cluster_pyramids
+
+    build_cluster_pyramids()
+
+
+def queue_cluster_pyramid_refresh():
+    """Rebuilds the cluster pyramids in the background after a bulk job, or
+    right away if celery is not running."""
+
+    try:
+        if celery_is_available():
+            refresh_cluster_pyramids.delay()  # pyright: ignore[reportFunctionMemberAccess]
+        else:
+            refresh_cluster_pyramids()
+    except Exception as e:
+        logger.warning(f"cluster pyramid refresh failed: {e}")
+
+
+@shared_task(bind=True, max_retries=3)
+def run_queued_spatial_joins(self):
+    """Joins every resource in the QueuedSpatialJoin table, with one bulk
+    join per graph. Resources that are queued again while this runs are left
+    for the next task. If a graph's join fails, its resources stay in the queue
+    and the task is retried; after the last retry they are picked up by the next
+    task that is scheduled."""
+    from django.conf import settings
+    from django.core.cache import cache
+    from django.utils import timezone
+    from hms.models import QueuedSpatialJoin
+    from fpan.utils import SpatialJoin
+
+    # later saves will schedule a new task from here on
+    cache.delete(SPATIAL_JOIN_SCHEDULED_KEY)
+
+    started = timezone.now()
+    queued = list(QueuedSpatialJoin.objects.filter(queued__lte=started))
+    by_graph = {}
+    for item in queued:
+        by_graph.setdefault(str(item.graph_id), []).append(item)
+
+    error = None
+    for graph in settings.GRAPH_LOOKUP.values():
+        items = by_graph.get(graph["id"])
+        if not items:
+            continue
+        resourceids = [str(i.resourceinstanceid) for i in items]
+        logger.debug(f"queued spatial join: {len(resourceids)} {graph['name']}")
+        try:
+            SpatialJoin(graph["name"]).update_resources(resourceids)
+        except Exception as e:
+            logger.error(f"error encountered during queued spatial join: {e}")
+            error = e
+            continue
+
+        # only the resources that were joined are removed from the queue
+        QueuedSpatialJoin.objects.filter(
+            pk__in=[i.pk for i in items], queued__lte=started
+        ).delete()
+
+    if error is not None:
+        raise self.retry(exc=error, countdown=settings.SPATIAL_JOIN_DEBOUNCE * 6)
+
+
+@shared_task
+def run_management_area_join(added=(), changed=None, removed=None):
+    from fpan.utils import defer_mvt_invalidation, join_management_area_changes
+
+    with defer_mvt_invalidation():
+        join_management_area_changes(added=added, changed=changed, removed=removed)
+
+    queue_cluster_pyramid_refresh()
+
+
+def queue_management_area_join(added=(), changed=None, removed=None):
+    """Runs the incremental join for an added, edited, or deleted management
+    area in the background, or right away if celery is not running. changed and
+    removed must be snapshots from before the edit (see
+    fpan.utils.get_management_area_snapshots)."""
+
+    if celery_is_available():
+        run_management_area_join.delay(  # pyright: ignore[reportFunctionMemberAccess]
+            added=list(added), changed=changed, removed=removed
+        )
+    else:
+        run_management_area_join(added=added, changed=changed, removed=removed)
+
+
+def queue_spatial_join(resourceinstance):
+    """Adds a resource to the spatial join queue, and schedules the task that
+    processes the queue unless one is already waiting. Edits made before the
+    task runs are coalesced into the same batch. Without celery the resource is
+    joined right away."""
+    from django.conf import settings
+    from django.core.cache import cache
+    from hms.models import QueuedSpatialJoin
     from fpan.utils import SpatialJoin
 
-    for graph_name in [
-        "Archaeological Site",
-        "Historic Cemetery",
-        "Historic Structure",
-    ]:
-        joiner = SpatialJoin(graph_name)
-        for res in ResourceInstance.objects.filter(graph__name=graph_name):
-            logger.debug(f"spatial join resource: {res.pk}")
-            joiner.update_resource(res)
+    if not celery_is_available():
+        joiner = SpatialJoin(resourceinstance.graph.name)
+        joiner.update_resource(resourceinstance)
+        return
+
+    QueuedSpatialJoin.objects.update_or_create(
+        resourceinstanceid=resourceinstance.pk,
+        defaults={"graph_id": resourceinstance.graph_id},
+    )
+    if cache.add(SPATIAL_JOIN_SCHEDULED_KEY, True, settings.SPATIAL_JOIN_DEBOUNCE * 6):
+        run_queued_spatial_joins.apply_async(  # pyright: ignore[reportFunctionMemberAccess]
+            countdown=settings.SPATIAL_JOIN_DEBOUNCE
+        )
@@ -1,21 +1,596 @@
 import json
+import math
 import time
 import logging
+import threading
+from contextlib import contextmanager
 from typing import TYPE_CHECKING, List
 from pathlib import Path
 
 from django.conf import settings
-from django.contrib.gis.geos import GEOSGeometry
+from django.core.cache import cache, caches
+from django.db import connection, transaction
+from django.db.models import Max, Q
 
 from arches.app.models.resource import Resource
 from arches.app.models.models import ResourceInstance, Node, Value
 from arches.app.models.tile import Tile
 
-from hms.models import ManagementArea, ManagementAgency
+from hms.models import (
+    ManagementArea,
+    ManagementAgency,
+    ClusterPyramid,
+    ClusterTile,
+    get_concept_value_ids,
+)
+from hms.permissions_backend import (
+    defer_accessible_resource_refresh,
+    prune_accessible_resource_sets,
+    refresh_accessible_resources,
+)
 
 logger = logging.getLogger(__name__)
 
-legal_value_ids = [str(i) for i in Value.objects.all().values_list("pk", flat=True)]
+RDM_CACHE_VERSION_KEY = "fpan_rdm_cache_version"
+
+
+def get_rdm_cache_version():
+    """Returns the token that is embedded in the key of anything cached from
+    the RDM (concepts, values, collections). It is replaced by signals whenever a
+    Value or Relation changes, which invalidates all of those entries at once."""
+
+    version = cache.get(RDM_CACHE_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        cache.add(RDM_CACHE_VERSION_KEY, version, None)
+        version = cache.get(RDM_CACHE_VERSION_KEY, version)
+    return version
+
+
+def bump_rdm_cache_version():
+    cache.set(RDM_CACHE_VERSION_KEY, time.time_ns(), None)
+
+
+## MVT tile cache. Cached tiles are keyed by node, access rule signature, and
+## z/x/y, along with two version tokens: a global generation that is replaced
+## after bulk jobs, and a per z/x/y version that is replaced when a resource
+## within (or next to) that tile changes.
+MVT_GENERATION_KEY = "mvt_generation"
+MERCATOR_MAX = 20037508.342789244
+
+_mvt_invalidation = threading.local()
+_management_area_join = threading.local()
+
+
+def get_mvt_cache():
+    return caches[settings.MVT_CACHE_ALIAS]
+
+
+def _get_mvt_generation(tile_cache):
+
+    generation = tile_cache.get(MVT_GENERATION_KEY)
+    if generation is None:
+        generation = time.time_ns()
+        tile_cache.add(MVT_GENERATION_KEY, generation, None)
+        generation = tile_cache.get(MVT_GENERATION_KEY, generation)
+    return generation
+
+
+def bump_mvt_generation():
+    """Invalidates every cached MVT tile, and marks all cluster pyramids stale
+    until they are rebuilt. Use after bulk jobs."""
+
+    get_mvt_cache().set(MVT_GENERATION_KEY, time.time_ns(), None)
+    ClusterPyramid.objects.filter(stale=False).update(stale=True)
+
+
+def get_mvt_cache_key(nodeid, signature, zoom, x, y):
+
+    tile_cache = get_mvt_cache()
+    generation = _get_mvt_generation(tile_cache)
+    version = tile_cache.get(f"mvt_version_{zoom}_{x}_{y}", 0)
+    return f"mvt_{generation}_{version}_{nodeid}_{signature}_{zoom}_{x}_{y}"
+
+
+@contextmanager
+def defer_mvt_invalidation(bump: bool = True):
+    """
+    Turns off the per-resource MVT tile invalidation in this thread, for bulk
+    jobs that would otherwise invalidate the same tiles over and over. The
+    generation is replaced on exit instead, which invalidates all tiles. Pass
+    bump=False in worker processes, and call bump_mvt_generation() once from
+    the parent after all workers have finished.
+    """
+
+    depth = getattr(_mvt_invalidation, "deferred", 0)
+    _mvt_invalidation.deferred = depth + 1
+    try:
+        yield
+    finally:
+        _mvt_invalidation.deferred = depth
+        if depth == 0 and bump:
+            bump_mvt_generation()
+
+
+def mvt_invalidation_is_deferred():
+    return getattr(_mvt_invalidation, "deferred", 0) > 0
+
+
+def get_resources_bbox(resourceids):
+    """Returns the (xmin, ymin, xmax, ymax) in EPSG:3857 of all geometries for
+    the given resources, or None if they have no geometries."""
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e) FROM (
+                SELECT ST_Extent(geom) AS e FROM geojson_geometries
+                WHERE resourceinstanceid = ANY(%s::uuid[])
+            ) extent;
+            """,
+            [[str(i) for i in resourceids]],
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return None
+    return row
+
+
+def invalidate_mvt_tiles(bbox):
+    """
+    Replaces the version of every cached z/x/y tile that covers the bbox (in
+    EPSG:3857), at all zooms up to MVT_CACHE_MAX_ZOOM. Each range is widened by
+    one tile, to cover features and clusters drawn across tile edges. If the
+    bbox covers more than MVT_INVALIDATION_MAX_TILES tiles at any zoom, the
+    generation is replaced instead, which invalidates all tiles at once.
+    """
+
+    if bbox is None or mvt_invalidation_is_deferred():
+        return
+
+    ranges = []
+    for zoom in range(0, settings.MVT_CACHE_MAX_ZOOM + 1):
+        xs, ys = get_tile_indexes(zoom, *bbox, margin=1)
+        if len(xs) * len(ys) > settings.MVT_INVALIDATION_MAX_TILES:
+            logger.debug(f"invalidating all mvt tiles, bbox too large: {bbox}")
+            bump_mvt_generation()
+            return
+        ranges.append((zoom, xs, ys))
+
+    version = time.time_ns()
+    versions = {}
+    for zoom, xs, ys in ranges:
+        for x in xs:
+            for y in ys:
+                versions[f"mvt_version_{zoom}_{x}_{y}"] = version
+    get_mvt_cache().set_many(versions, settings.TILE_CACHE_TIMEOUT)
+
+    # remove the same tiles from the cluster pyramids, they are built live
+    # until the next pyramid refresh
+    max_zoom = ClusterPyramid.objects.aggregate(Max("max_zoom"))["max_zoom__max"]
+    if max_zoom is not None:
+        tiles = Q()
+        for zoom, xs, ys in ranges[: max_zoom + 1]:
+            tiles |= Q(
+                zoom=zoom,
+                x__range=(xs.start, xs.stop - 1),
+                y__range=(ys.start, ys.stop - 1),
+            )
+        ClusterTile.objects.filter(tiles).delete()
+
+
+def invalidate_mvt_tiles_for_resources(resourceids):
+
+    if mvt_invalidation_is_deferred():
+        return
+    invalidate_mvt_tiles(get_resources_bbox(resourceids))
+
+
+## MVT tile generation, shared by the MVT view and the cluster pyramid builder.
+EARTHCIRCUM = 40075016.6856
+PIXELSPERTILE = 256
+
+# the permission restriction is either a join against the materialized set of
+# accessible resources for the rule, or a single uuid[] parameter, so planning
+# does not depend on the number of resources a user can see
+MVT_RESOURCE_SET_FILTER = """AND resourceinstanceid IN (
+    SELECT resourceinstanceid FROM hms_accessibleresource
+    WHERE resource_set_id = %(resource_set_id)s
+)"""
+MVT_RESOURCEIDS_FILTER = "AND resourceinstanceid = ANY(%(valid_resids)s::uuid[])"
+
+MVT_CLUSTER_SQL = """WITH clusters(tileid, resourceinstanceid, nodeid, geom, cid)
+    AS (
+        SELECT m.*,
+        ST_ClusterDBSCAN(geom, eps := %(distance)s, minpoints := %(min_points)s) over () AS cid
+        FROM (
+            SELECT tileid,
+                resourceinstanceid,
+                nodeid,
+                geom
+            FROM geojson_geometries
+            WHERE nodeid = %(nodeid)s {resource_filter}
+                AND geom && ST_Expand(TileBBox(%(zoom)s, %(x)s, %(y)s, 3857), %(distance)s + %(buffer)s)
+        ) m
+    )
+
+    SELECT ST_AsMVT(
+        tile,
+        %(nodeid)s,
+        4096,
+        'geom',
+        'id'
+    ) FROM (
+        SELECT resourceinstanceid::text,
+            row_number() over () as id,
+            1 as total,
+            ST_AsMVTGeom(
+                geom,
+                TileBBox(%(zoom)s, %(x)s, %(y)s, 3857)
+            ) AS geom,
+            '' AS extent
+        FROM clusters
+        WHERE cid is NULL
+        UNION
+        SELECT NULL as resourceinstanceid,
+            row_number() over () as id,
+            count(*) as total,
+            ST_AsMVTGeom(
+                ST_Centroid(
+                    ST_Collect(geom)
+                ),
+                TileBBox(%(zoom)s, %(x)s, %(y)s, 3857)
+            ) AS geom,
+            ST_AsGeoJSON(
+                ST_Extent(geom)
+            ) AS extent
+        FROM clusters
+        WHERE cid IS NOT NULL
+        GROUP BY cid
+    ) AS tile;"""
+
+MVT_SQL = """SELECT ST_AsMVT(tile, %(nodeid)s, 4096, 'geom', 'id') FROM (SELECT tileid,
+        id,
+        resourceinstanceid,
+        nodeid,
+        ST_AsMVTGeom(
+            geom,
+            TileBBox(%(zoom)s, %(x)s, %(y)s, 3857)
+        ) AS geom,
+        1 AS total
+    FROM geojson_geometries
+    WHERE nodeid = %(nodeid)s {resource_filter}
+        AND geom && ST_Expand(TileBBox(%(zoom)s, %(x)s, %(y)s, 3857), %(buffer)s)) AS tile;"""
+
+
+def build_mvt_tile(
+    nodeid, zoom, x, y, config, resourceids=None, resource_set_id=None
+) -> bytes:
+    """
+    Returns the MVT tile for a geojson node. With no resourceids or
+    resource_set_id, all resources are included (full access). Otherwise,
+    only the listed resources, or the members of the AccessibleResourceSet.
+    Zooms at or below the node's clusterMaxZoom are clustered.
+    """
+
+    query_params = {
+        "nodeid": str(nodeid),
+        "zoom": int(zoom),
+        "x": int(x),
+        "y": int(y),
+        # width of the default 256/4096 geometry buffer in ST_AsMVTGeom,
+        # used to select features drawn just outside of the tile
+        "buffer": EARTHCIRCUM / (1 << int(zoom)) * 256 / 4096,
+    }
+
+    resource_filter = ""
+    if resource_set_id is not None:
+        resource_filter = MVT_RESOURCE_SET_FILTER
+        query_params["resource_set_id"] = resource_set_id
+    elif resourceids is not None:
+        resource_filter = MVT_RESOURCEIDS_FILTER
+        query_params["valid_resids"] = [str(i) for i in resourceids]
+
+    if int(zoom) <= int(config["clusterMaxZoom"]):
+        arc = EARTHCIRCUM / ((1 << int(zoom)) * PIXELSPERTILE)
+        # add some extra query_params to support clustering
+        query_params["distance"] = arc * int(config["clusterDistance"])
+        query_params["min_points"] = int(config["clusterMinPoints"])
+
+        # only geometries within the tile (and its geometry buffer), plus
+        # the cluster distance, are clustered. this lets clusters that
+        # straddle the tile edge form the same way in the adjacent tile.
+        sql = MVT_CLUSTER_SQL.format(resource_filter=resource_filter)
+    else:
+        sql = MVT_SQL.format(resource_filter=resource_filter)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, query_params)
+        return bytes(cursor.fetchone()[0])
+
+
+def get_tile_indexes(zoom, xmin, ymin, xmax, ymax, margin=0):
+    """Returns the x and y ranges of the z/x/y tiles covering a bbox in
+    EPSG:3857, widened by margin tiles on each side."""
+
+    count = 1 << zoom
+    size = (MERCATOR_MAX * 2) / count
+
+    def _index(value):
+        return min(max(int(math.floor(value / size)), 0), count - 1)
+
+    x0 = max(_index(xmin + MERCATOR_MAX) - margin, 0)
+    x1 = min(_index(xmax + MERCATOR_MAX) + margin, count - 1)
+    y0 = max(_index(MERCATOR_MAX - ymax) - margin, 0)
+    y1 = min(_index(MERCATOR_MAX - ymin) + margin, count - 1)
+    return range(x0, x1 + 1), range(y0, y1 + 1)
+
+
+def get_cluster_tile(nodeid, signature, zoom, x, y):
+    """
+    Returns the precomputed tile for this rule signature from its cluster
+    pyramid, or None if there is no current pyramid, or the pyramid has no tile
+    here (tiles are only stored around resources, and are removed when a
+    resource in them changes). In that case the tile must be built live.
+    """
+
+    tile = (
+        ClusterTile.objects.filter(
+            pyramid__nodeid=nodeid,
+            pyramid__signature=signature,
+            pyramid__stale=False,
+            zoom=int(zoom),
+            x=int(x),
+            y=int(y),
+        )
+        .values_list("tile", flat=True)
+        .first()
+    )
+    return bytes(tile) if tile is not None else None
+
+
+CLUSTER_PYRAMID_USE_KEY = "cluster_pyramid_used_{signature}"
+
+
+def mark_cluster_pyramid_used(signature):
+    """Records that clustered tiles were requested for a rule signature, so its
+    pyramid is precomputed by the next build_cluster_pyramids(). The timeout
+    runs from the latest request."""
+
+    cache.set(
+        CLUSTER_PYRAMID_USE_KEY.format(signature=signature),
+        True,
+        settings.CLUSTER_PYRAMID_RECENT_USE,
+    )
+
+
+def cluster_pyramid_was_used(signature) -> bool:
+    return bool(cache.get(CLUSTER_PYRAMID_USE_KEY.format(signature=signature)))
+
+
+def get_nonempty_tile_indexes(nodeid, zoom, indexes, resource_set_id=None) -> list:
+    """Returns the (x, y) pairs from indexes whose tile, with its geometry
+    buffer, holds at least one geometry of the node. Only these are worth
+    building with ST_AsMVT."""
+
+    if not indexes:
+        return []
+    resource_filter = ""
+    if resource_set_id is not None:
+        resource_filter = MVT_RESOURCE_SET_FILTER
+
+    xs, ys = zip(*indexes)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""SELECT t.x, t.y FROM unnest(%(xs)s::int[], %(ys)s::int[]) AS t(x, y)
+            WHERE EXISTS (
+                SELECT 1 FROM geojson_geometries
+                WHERE nodeid = %(nodeid)s {resource_filter}
+                    AND geom && ST_Expand(TileBBox(%(zoom)s, t.x, t.y, 3857), %(buffer)s)
+            );""",
+            {
+                "nodeid": str(nodeid),
+                "zoom": int(zoom),
+                "xs": list(xs),
+                "ys": list(ys),
+                "buffer": EARTHCIRCUM / (1 << int(zoom)) * 256 / 4096,
+                "resource_set_id": resource_set_id,
+            },
+        )
+        return cursor.fetchall()
+
+
+def build_cluster_pyramid(node, signature, resource_set=None) -> ClusterPyramid:
+    """
+    Precomputes the tiles of a geojson node for every zoom up to its
+    clusterMaxZoom (or CLUSTER_PYRAMID_MAX_ZOOM, if lower), for either all
+    resources or the members of an AccessibleResourceSet. Tiles are made for
+    every z/x/y that holds a resource geometry. The tiles are built first, and
+    then swapped in with a short transaction for this pyramid alone.
+    """
+
+    config = node.config
+    max_zoom = min(int(config["clusterMaxZoom"]), settings.CLUSTER_PYRAMID_MAX_ZOOM)
+    resource_set_id = resource_set.pk if resource_set else None
+
+    resource_filter = ""
+    if resource_set_id is not None:
+        resource_filter = MVT_RESOURCE_SET_FILTER
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""SELECT ST_XMin(geom), ST_YMin(geom), ST_XMax(geom), ST_YMax(geom)
+            FROM geojson_geometries WHERE nodeid = %(nodeid)s {resource_filter};""",
+            {"nodeid": str(node.pk), "resource_set_id": resource_set_id},
+        )
+        bboxes = cursor.fetchall()
+
+    start = time.time()
+    tiles = []
+    for zoom in range(0, max_zoom + 1):
+        indexes = set()
+        for bbox in bboxes:
+            xs, ys = get_tile_indexes(zoom, *bbox, margin=1)
+            indexes.update([(x, y) for x in xs for y in ys])
+        indexes = get_nonempty_tile_indexes(
+            node.pk, zoom, list(indexes), resource_set_id=resource_set_id
+        )
+        for x, y in indexes:
+            tile = build_mvt_tile(
+                node.pk, zoom, x, y, config, resource_set_id=resource_set_id
+            )
+            if len(tile):
+                tiles.append(ClusterTile(zoom=zoom, x=x, y=y, tile=tile))
+
+    with transaction.atomic():
+        pyramid, created = ClusterPyramid.objects.get_or_create(
+            nodeid=node.pk,
+            signature=signature,
+            defaults={"resource_set": resource_set, "max_zoom": max_zoom},
+        )
+        pyramid.tiles.all().delete()
+        for tile in tiles:
+            tile.pyramid = pyramid
+        ClusterTile.objects.bulk_create(tiles, batch_size=1000)
+
+        pyramid.resource_set = resource_set
+        pyramid.max_zoom = max_zoom
+        pyramid.stale = False
+        pyramid.save()
+
+    logger.debug(
+        f"cluster pyramid built for {node.pk} | {signature}: {time.time() - start}"
+    )
+    return pyramid
+
+
+def build_cluster_pyramids():
+    """Rebuilds the cluster pyramids for every geojson node of the FMSF graphs,
+    for full access and for each AccessibleResourceSet of the node's graph.
+    Only rules whose clustered tiles were requested within the last
+    CLUSTER_PYRAMID_RECENT_USE seconds are built, and each pyramid is committed
+    on its own."""
+
+    from hms.models import AccessibleResourceSet
+    from fpan.search.components.rule_filter import Rule
+
+    prune_accessible_resource_sets()
+
+    graphids = [
+        i["id"] for i in settings.GRAPH_LOOKUP.values() if "spatial_node_lookup" in i
+    ]
+    nodes = Node.objects.filter(
+        graph_id__in=graphids, datatype="geojson-feature-collection"
+    )
+    for node in nodes:
+        if not node.config or "clusterMaxZoom" not in node.config:
+            continue
+        graphid = str(node.graph_id)
+        signature = Rule("full_access", graph_id=graphid).signature
+        if cluster_pyramid_was_used(signature):
+            build_cluster_pyramid(node, signature)
+        for resource_set in AccessibleResourceSet.objects.filter(graph_id=graphid):
+            if cluster_pyramid_was_used(resource_set.signature):
+                build_cluster_pyramid(node, resource_set.signature, resource_set)
+
+    # pyramids for sets that no longer exist are removed by the cascade, this
+    # clears those that were not rebuilt, or are for nodes that are no longer
+    # clustered
+    ClusterPyramid.objects.filter(stale=True).delete()
+
+
+## holds the RDM cache version and the set of value ids that were current
+## when get_legal_value_ids() last built it
+_legal_value_ids = (None, set())
+
+
+def get_legal_value_ids() -> set:
+    """
+    Returns the set of value ids that may be used in the County and FPAN Region
+    nodes, i.e. the values of all concepts in those nodes' collections. The set
+    is built on first use, and rebuilt when the RDM cache version changes.
+    """
+    global _legal_value_ids
+
+    version = get_rdm_cache_version()
+    if _legal_value_ids[0] == version:
+        return _legal_value_ids[1]
+
+    nodeids = []
+    for graph in settings.GRAPH_LOOKUP.values():
+        if "spatial_node_lookup" in graph:
+            nodeids.append(graph["spatial_node_lookup"]["county_nodeid"])
+            nodeids.append(graph["spatial_node_lookup"]["region_nodeid"])
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            WITH RECURSIVE members AS (
+                SELECT r.conceptidto FROM relations r
+                WHERE r.relationtype = 'member' AND r.conceptidfrom IN (
+                    SELECT DISTINCT (config ->> 'rdmCollection')::uuid FROM nodes
+                    WHERE nodeid = ANY(%s::uuid[])
+                    AND config ->> 'rdmCollection' IS NOT NULL
+                )
+                UNION
+                SELECT r.conceptidto FROM relations r
+                JOIN members m ON r.conceptidfrom = m.conceptidto
+                WHERE r.relationtype = 'member'
+            )
+            SELECT v.valueid FROM "values" v
+            JOIN members m ON v.conceptid = m.conceptidto;
+            """,
+            [nodeids],
+        )
+        legal = set([str(i[0]) for i in cursor.fetchall()])
+
+    # fall back to all values rather than dropping every county and region
+    if not legal:
+        logger.warning("no County or FPAN Region collection values found")
+        legal = set([str(i) for i in Value.objects.values_list("pk", flat=True)])
+    _legal_value_ids = (version, legal)
+    return legal
+
+
+_county_lookup = (None, {})
+
+
+def get_county_lookup() -> dict:
+    """
+    Returns the contents of data/county_lookup.json, FMSF county code: county
+    and FPAN region names, with the concept value ids of the county and region
+    added to each entry. It is built once per process, with one query for all
+    values, and rebuilt when the RDM cache version changes.
+    """
+    global _county_lookup
+
+    version = get_rdm_cache_version()
+    if _county_lookup[0] == version:
+        return _county_lookup[1]
+
+    with open(Path(settings.APP_ROOT, "data", "county_lookup.json"), "r") as o:
+        lookup = json.load(o)
+
+    county_labels = [f"{i['county']} County" for i in lookup.values()]
+    values = Value.objects.filter(
+        Q(value__in=county_labels) | Q(value__startswith="FPAN "),
+        language_id="en",
+        valuetype_id="prefLabel",
+    ).values_list("value", "pk")
+    values = [(label, str(valueid)) for label, valueid in values]
+
+    for code, entry in lookup.items():
+        county_label = f"{entry['county']} County"
+        county_ids = [i[1] for i in values if i[0] == county_label]
+        region_label = f"FPAN {entry['region']} Region"
+        region_ids = [i[1] for i in values if i[0].startswith(region_label)]
+        if not county_ids or not region_ids:
+            logger.warning(f"missing county or region value for county code {code}")
+        entry["county_concept_value_id"] = county_ids[0] if county_ids else None
+        entry["region_concept_value_id"] = region_ids[0] if region_ids else None
+
+    _county_lookup = (version, lookup)
+    return lookup
 
 
 class SpatialJoin:
@@ -24,113 +599,403 @@ class SpatialJoin:
         self.node_lookup = {}
         for graph in settings.GRAPH_LOOKUP.values():
             if graph["name"] == graph_name:
+                self.graphid = graph["id"]
                 self.node_lookup = graph["spatial_node_lookup"]
         if not self.node_lookup:
             raise Exception(f"Invalid graph name provided to SpatialJoin: {graph_name}")
 
-        self.valid_management_area_vals = [
-            i.concept_value_id for i in ManagementArea.objects.all()
-        ]
-        self.valid_management_agency_vals = [
-            i.concept_value_id for i in ManagementAgency.objects.all()
-        ]
+        geom_node = Node.objects.get(
+            graph_id=self.graphid, datatype="geojson-feature-collection"
+        )
+        self.geom_nodeid = str(geom_node.pk)
+        self.geom_nodegroupid = str(geom_node.nodegroup_id)
+
+        self.refresh_valid_values()
 
         self.county_lookup = self.hydrate_county_lookup()
 
+    def refresh_valid_values(self):
+
+        area_concepts = ManagementArea.objects.values_list("concept_id", flat=True)
+        agency_concepts = ManagementAgency.objects.values_list("concept_id", flat=True)
+        self.valid_management_area_vals = set(
+            get_concept_value_ids(area_concepts).values()
+        )
+        self.valid_management_agency_vals = set(
+            get_concept_value_ids(agency_concepts).values()
+        )
+
     def hydrate_county_lookup(self) -> dict:
 
-        with open(Path(settings.APP_ROOT, "data", "county_lookup.json"), "r") as o:
-            lookup = json.load(o)
+        return get_county_lookup()
 
-        for entry in lookup.values():
-            county_label = f"{entry['county']} County"
-            county_value = Value.objects.get(
-                value=county_label,
-                language_id="en",
-                valuetype_id="prefLabel",
-            )
-            entry["county_concept_value_id"] = str(county_value.pk)
+    def update_resource(self, resourceinstance, index: bool = True):
 
-            region_label = f"FPAN {entry['region']} Region"
-            region_value = Value.objects.get(
-                value__startswith=region_label,
-                language_id="en",
-                valuetype_id="prefLabel",
-            )
-            entry["region_concept_value_id"] = str(region_value.pk)
+        self.update_resources([resourceinstance.pk], index=index)
 
-        return lookup
+    def update_graph(self, index: bool = True, chunk_size: int = 1000) -> List[str]:
+        """Runs the join on every resource in this joiner's graph."""
 
-    def update_resource(self, resourceinstance, index: bool = True):
+        resourceids = ResourceInstance.objects.filter(
+            graph_id=self.graphid
+        ).values_list("pk", flat=True)
+        return self.update_resources(
+            list(resourceids), index=index, chunk_size=chunk_size
+        )
 
-        # get list of areas to pull info from
-        intersecting_areas = self.get_areas_for_resourceinstance(resourceinstance)
+    def update_resources(
+        self, resourceids, index: bool = True, chunk_size: int = 1000
+    ) -> List[str]:
+        """
+        Joins a set of resources to the management areas, in chunks. For each
+        chunk the intersections and FMSF IDs are found with one query apiece,
+        the final area, agency, county, and region values are computed in a
+        single pass, and each resource's management tile is saved at most once.
+        Returns the ids of the resources whose management tile was changed.
+        """
 
-        for area in intersecting_areas:
-            self.apply_management_area_attributes(resourceinstance, area)
+        changed = []
+        resourceids = [str(i) for i in resourceids]
+        for start in range(0, len(resourceids), chunk_size):
+            chunk = resourceids[start : start + chunk_size]
+            with defer_accessible_resource_refresh():
+                chunk_changed = self._update_resource_chunk(chunk)
+            self.refresh_access(chunk_changed)
+            if index:
+                for resource in Resource.objects.filter(pk__in=chunk_changed):
+                    resource.index()
+            changed += chunk_changed
+            logger.debug(
+                f"spatial join: {start + len(chunk)}/{len(resourceids)} resources"
+            )
+        return changed
 
-        resource = Resource.objects.get(pk=resourceinstance.pk)
-        self.apply_fpan_region_and_county_attributes(resource)
+    def refresh_access(self, resourceids: List[str]):
+        """Updates the management projection and the accessible resource sets
+        for a batch of resources whose management tiles were saved while the
+        per-tile refresh was deferred."""
 
-        if index:
-            resource.index()
+        if not resourceids:
+            return
+        nodegroupid = self.node_lookup["nodegroupid"]
+        update_management_projection(resourceids, nodegroupid=nodegroupid)
+        refresh_accessible_resources(resourceids, nodegroupids=[nodegroupid])
 
-    def get_areas_for_resourceinstance(
-        self, resourceinstance: ResourceInstance
-    ) -> List[ManagementArea]:
+    def _update_resource_chunk(self, resourceids: List[str]) -> List[str]:
 
-        try:
-            geom_tile = Tile.objects.get(
-                nodegroup_id__in=settings.SPATIAL_COORDINATES_NODEGROUPS_IDS,
-                resourceinstance=resourceinstance,
-            )
-        except Tile.DoesNotExist:
-            return []
+        changed = []
+        legal_value_ids = get_legal_value_ids()
+        area_lookup = self.get_area_values_for_resources(resourceids)
+        siteid_lookup = self.get_siteids_for_resources(resourceids)
 
-        resource_geojson = None
-        if geom_tile.data:
-            geom_node = Node.objects.get(
-                graph=resourceinstance.graph, datatype="geojson-feature-collection"
+        tiles = {
+            str(i.resourceinstance_id): i
+            for i in Tile.objects.filter(
+                nodegroup_id=self.node_lookup["nodegroupid"],
+                resourceinstance_id__in=resourceids,
             )
-            try:
-                resource_geojson = geom_tile.data[str(geom_node.pk)]
-            except KeyError:
-                logger.warning(
-                    f"no geojson node data in this resource: {resourceinstance.pk}"
+        }
+
+        for resourceid in resourceids:
+            tile = tiles.get(resourceid)
+            if tile is None:
+                tile = Tile().get_blank_tile(
+                    self.node_lookup["nodegroupid"], resourceid=resourceid
+                )
+            self.prepare_management_tile(tile)
+
+            if TYPE_CHECKING and not tile.data:
+                continue
+
+            area_vals, agency_vals = area_lookup.get(resourceid, (set(), set()))
+            county_vals, region_vals = set(), set()
+
+            siteid = siteid_lookup.get(resourceid)
+            if not siteid:
+                logger.warning(f"missing FSMF site id on resource: {resourceid}")
+            else:
+                entry = self.county_lookup.get(siteid[:2].upper())
+                if not entry:
+                    logger.warning(
+                        f"no entry in county lookup for {siteid[:2].upper()}: {resourceid}"
+                    )
+                else:
+                    county_vals.add(entry["county_concept_value_id"])
+                    region_vals.add(entry["region_concept_value_id"])
+
+            # new values are added to those already present, and the result is
+            # limited to values that are still valid
+            results = [
+                self._merge_values(
+                    tile, "area_nodeid", area_vals, self.valid_management_area_vals
+                ),
+                self._merge_values(
+                    tile,
+                    "agency_nodeid",
+                    agency_vals,
+                    self.valid_management_agency_vals,
+                ),
+                self._merge_values(tile, "county_nodeid", county_vals, legal_value_ids),
+                self._merge_values(tile, "region_nodeid", region_vals, legal_value_ids),
+            ]
+
+            # new tiles are always saved, existing ones only if they changed
+            if resourceid not in tiles or any(results):
+                tile.save(
+                    index=False,
+                    # edit_log_entry=False
                 )
-                return []
-        if not resource_geojson:
-            print("no data in this geom tile")
+                changed.append(resourceid)
+
+        return changed
+
+    def update_for_area_changes(
+        self,
+        added=(),
+        changed=None,
+        removed=None,
+        index: bool = True,
+        chunk_size: int = 1000,
+    ) -> List[str]:
+        """
+        Applies a set of management area changes to the resources in this graph,
+        without re-joining them against every other area.
+
+        added is a list of ids of new areas. changed and removed are dicts of
+        the areas' state from before the change, as returned by
+        get_management_area_snapshots(), which must be captured before the
+        areas are edited or deleted.
+
+        Only resources that intersect a new geometry or an old one are touched,
+        and only the values that come from the changed areas and their agencies
+        are recomputed. Resources with no management tile yet get a full join.
+        Returns the ids of the resources whose management tile was changed.
+        """
+
+        changed = changed or {}
+        removed = removed or {}
+        touched_ids = list(set([int(i) for i in list(added) + list(changed.keys())]))
+        old_snapshots = list(changed.values()) + list(removed.values())
+
+        if not touched_ids and not old_snapshots:
             return []
 
-        area_pks = []
-        for feat in resource_geojson["features"]:
-            geom_str = json.dumps(feat["geometry"])
-            geom = GEOSGeometry(geom_str)
-            pks = ManagementArea.objects.filter(geom__intersects=geom).values_list(
-                "pk", flat=True
+        self.refresh_valid_values()
+        current_snapshots = get_management_area_snapshots(touched_ids)
+
+        # all values from these areas are stale, and will be recomputed
+        stale_area_vals = set(
+            [
+                i["area_valueid"]
+                for i in old_snapshots + list(current_snapshots.values())
+            ]
+        )
+        stale_agency_vals = set(
+            [
+                i["agency_valueid"]
+                for i in old_snapshots + list(current_snapshots.values())
+            ]
+        )
+        stale_area_vals.discard(None)
+        stale_agency_vals.discard(None)
+
+        resourceids = self.get_resources_for_area_changes(
+            touched_ids, [i["wkt"] for i in old_snapshots]
+        )
+
+        changed = []
+        for start in range(0, len(resourceids), chunk_size):
+            chunk = resourceids[start : start + chunk_size]
+            with defer_accessible_resource_refresh():
+                chunk_changed = self._update_resource_chunk_for_area_changes(
+                    chunk, touched_ids, stale_area_vals, stale_agency_vals
+                )
+            self.refresh_access(chunk_changed)
+            if index:
+                for resource in Resource.objects.filter(pk__in=chunk_changed):
+                    resource.index()
+            changed += chunk_changed
+            logger.debug(
+                f"incremental spatial join: {start + len(chunk)}/{len(resourceids)} resources"
             )
-            area_pks += pks
+        return changed
 
-        areas = list(
-            ManagementArea.objects.exclude(category__name="FPAN Region").filter(
-                pk__in=area_pks
+    def _update_resource_chunk_for_area_changes(
+        self, resourceids, touched_ids, stale_area_vals, stale_agency_vals
+    ):
+
+        tiles = {
+            str(i.resourceinstance_id): i
+            for i in Tile.objects.filter(
+                nodegroup_id=self.node_lookup["nodegroupid"],
+                resourceinstance_id__in=resourceids,
             )
+        }
+        changed = []
+        new_resourceids = [i for i in resourceids if i not in tiles]
+        if new_resourceids:
+            changed += self._update_resource_chunk(new_resourceids)
+
+        area_lookup = self.get_area_values_for_resources(
+            list(tiles.keys()), area_ids=touched_ids
         )
+        agency_lookup = self.get_area_values_for_resources(
+            list(tiles.keys()), agency_valueids=list(stale_agency_vals)
+        )
+        for resourceid, tile in tiles.items():
+            self.prepare_management_tile(tile)
+            area_vals = area_lookup.get(resourceid, (set(), set()))[0]
+            agency_vals = agency_lookup.get(resourceid, (set(), set()))[1]
 
-        return areas
+            area_changed = self._merge_values(
+                tile,
+                "area_nodeid",
+                area_vals,
+                self.valid_management_area_vals,
+                stale_vals=stale_area_vals,
+            )
+            agency_changed = self._merge_values(
+                tile,
+                "agency_nodeid",
+                agency_vals,
+                self.valid_management_agency_vals,
+                stale_vals=stale_agency_vals,
+            )
+            if area_changed or agency_changed:
+                tile.save(
+                    index=False,
+                    # edit_log_entry=False
+                )
+                changed.append(resourceid)
 
-    def get_management_tile(self, resourceinstance: ResourceInstance) -> Tile:
+        return changed
 
-        try:
-            tile = Tile.objects.get(
-                nodegroup_id=self.node_lookup["nodegroupid"],
-                resourceinstance=resourceinstance,
+    def get_resources_for_area_changes(self, area_ids, old_wkts) -> List[str]:
+        """Returns the ids of all resources in this graph that intersect either
+        the current geometry of the given areas, or any of the old geometries.
+        The area geometries are transformed once, up front, so the join against
+        geojson_geometries can use its spatial index."""
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                WITH areas AS MATERIALIZED (
+                    SELECT ST_Transform(ma.geom, 3857) AS geom
+                    FROM hms_managementarea ma
+                    WHERE ma.id = ANY(%(area_ids)s::bigint[])
+                    UNION ALL
+                    SELECT ST_Transform(ST_GeomFromText(old.wkt, 4326), 3857)
+                    FROM unnest(%(old_wkts)s::text[]) AS old(wkt)
+                )
+                SELECT DISTINCT gg.resourceinstanceid FROM areas a
+                JOIN geojson_geometries gg
+                    ON gg.geom && a.geom AND ST_Intersects(gg.geom, a.geom)
+                JOIN resource_instances ri ON ri.resourceinstanceid = gg.resourceinstanceid
+                WHERE ri.graphid = %(graphid)s;
+                """,
+                {"graphid": self.graphid, "area_ids": area_ids, "old_wkts": old_wkts},
             )
-        except Tile.DoesNotExist:
-            tile = Tile().get_blank_tile(
-                self.node_lookup["nodegroupid"], resourceid=resourceinstance.pk
+            return [str(i[0]) for i in cursor.fetchall()]
+
+    def _merge_values(
+        self, tile: Tile, node_key: str, new_vals, valid_vals, stale_vals=()
+    ) -> bool:
+        """Adds new_vals to the node's current values, after removing any
+        stale_vals, and keeps only valid values. Returns True if this changed
+        the values on the tile."""
+
+        if TYPE_CHECKING and not tile.data:
+            return False
+
+        nodeid = self.node_lookup[node_key]
+        current = [i for i in tile.data[nodeid] if i not in stale_vals]
+        merged = list(set([i for i in current + list(new_vals) if i in valid_vals]))
+        changed = set(merged) != set(tile.data[nodeid])
+        tile.data[nodeid] = merged
+        return changed
+
+    def get_area_values_for_resources(
+        self, resourceids: List[str], area_ids=None, agency_valueids=None
+    ) -> dict:
+        """
+        Intersects the geometries of the given resources with all management
+        areas (excluding FPAN Regions) in one query, and returns a dict of
+        resourceid: (area concept value ids, agency concept value ids). The
+        areas can be limited to a list of ids, or to those of certain agencies.
+
+        Geometries are read from the resources' tile data rather than the
+        geojson_geometries table, which is not populated while the FMSF importer
+        has the spatial attributes trigger disabled.
+        """
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                WITH resource_geoms AS (
+                    SELECT t.resourceinstanceid,
+                        ST_SetSRID(ST_GeomFromGeoJSON((f -> 'geometry')::text), 4326) AS geom
+                    FROM tiles t, jsonb_array_elements(
+                        CASE jsonb_typeof(t.tiledata -> %(nodeid)s -> 'features')
+                            WHEN 'array' THEN t.tiledata -> %(nodeid)s -> 'features'
+                            ELSE '[]'::jsonb
+                        END
+                    ) f
+                    WHERE t.nodegroupid = %(nodegroupid)s
+                    AND t.resourceinstanceid = ANY(%(resourceids)s::uuid[])
+                )
+                SELECT DISTINCT rg.resourceinstanceid, av.valueid, agv.valueid
+                FROM resource_geoms rg
+                JOIN hms_managementarea ma ON ST_Intersects(ma.geom, rg.geom)
+                LEFT JOIN hms_managementareacategory mac ON mac.id = ma.category_id
+                LEFT JOIN "values" av ON av.conceptid = ma.concept_id
+                    AND av.languageid = 'en' AND av.valuetype = 'prefLabel'
+                LEFT JOIN hms_managementagency ag ON ag.code = ma.management_agency_id
+                LEFT JOIN "values" agv ON agv.conceptid = ag.concept_id
+                    AND agv.languageid = 'en' AND agv.valuetype = 'prefLabel'
+                WHERE mac.name IS DISTINCT FROM 'FPAN Region'
+                AND (%(area_ids)s::bigint[] IS NULL OR ma.id = ANY(%(area_ids)s::bigint[]))
+                AND (
+                    %(agency_valueids)s::uuid[] IS NULL
+                    OR agv.valueid = ANY(%(agency_valueids)s::uuid[])
+                );
+                """,
+                {
+                    "nodeid": self.geom_nodeid,
+                    "nodegroupid": self.geom_nodegroupid,
+                    "resourceids": resourceids,
+                    "area_ids": area_ids,
+                    "agency_valueids": agency_valueids,
+                },
             )
+            rows = cursor.fetchall()
+
+        lookup = {}
+        for resourceid, area_val, agency_val in rows:
+            area_vals, agency_vals = lookup.setdefault(str(resourceid), (set(), set()))
+            if area_val is not None:
+                area_vals.add(str(area_val))
+            if agency_val is not None:
+                agency_vals.add(str(agency_val))
+        return lookup
+
+    def get_siteids_for_resources(self, resourceids: List[str]) -> dict:
+        """Returns a dict of resourceid: FMSF ID for the given resources."""
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT t.resourceinstanceid,
+                    t.tiledata -> n.nodeid::text -> 'en' ->> 'value'
+                FROM tiles t
+                JOIN nodes n ON n.nodegroupid = t.nodegroupid
+                WHERE n.graphid = %(graphid)s AND n.name = 'FMSF ID'
+                AND t.resourceinstanceid = ANY(%(resourceids)s::uuid[]);
+                """,
+                {"graphid": self.graphid, "resourceids": resourceids},
+            )
+            return {str(i[0]): i[1] for i in cursor.fetchall() if i[1]}
+
+    def prepare_management_tile(self, tile: Tile) -> Tile:
 
         if TYPE_CHECKING and not tile.data:
             return tile
@@ -147,104 +1012,140 @@ class SpatialJoin:
 
         return tile
 
-    def apply_management_area_attributes(
-        self, resourceinstance: ResourceInstance, area: ManagementArea
-    ):
-        """Takes in a resource instance and a ManagementArea, and attaches the ManagementArea
-        and ManagementAgency concepts to the resource."""
 
-        tile = self.get_management_tile(resourceinstance)
+def get_management_area_snapshots(area_ids) -> dict:
+    """
+    Returns a dict of area id: {"wkt", "area_valueid", "agency_valueid"} for the
+    given management areas. Take a snapshot of areas before they are edited or
+    deleted, and pass it to join_management_area_changes().
+    """
 
-        if TYPE_CHECKING and not tile.data:
-            return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT ma.id, ST_AsText(ma.geom), av.valueid, agv.valueid
+            FROM hms_managementarea ma
+            LEFT JOIN "values" av ON av.conceptid = ma.concept_id
+                AND av.languageid = 'en' AND av.valuetype = 'prefLabel'
+            LEFT JOIN hms_managementagency ag ON ag.code = ma.management_agency_id
+            LEFT JOIN "values" agv ON agv.conceptid = ag.concept_id
+                AND agv.languageid = 'en' AND agv.valuetype = 'prefLabel'
+            WHERE ma.id = ANY(%s::bigint[]);
+            """,
+            [[int(i) for i in area_ids]],
+        )
+        return {
+            row[0]: {
+                "wkt": row[1],
+                "area_valueid": str(row[2]) if row[2] else None,
+                "agency_valueid": str(row[3]) if row[3] else None,
+            }
+            for row in cursor.fetchall()
+        }
 
-        val = area.concept_value_id
-        tile.data[self.node_lookup["area_nodeid"]].append(val)
 
-        # add the agency if available
-        if area.management_agency is not None:
-            tile.data[self.node_lookup["agency_nodeid"]].append(
-                area.management_agency.concept_value_id
-            )
+@contextmanager
+def defer_management_area_join():
+    """
+    Turns off the join that runs after a management area is saved or deleted
+    (see fpan.signals) in this thread. Bulk imports that create many areas use
+    this, and call join_management_area_changes() once for all of them.
+    """
 
-        # finalize with some QA/QC
-        tile.data[self.node_lookup["area_nodeid"]] = list(
-            set(
-                [
-                    i
-                    for i in tile.data[self.node_lookup["area_nodeid"]]
-                    if i in self.valid_management_area_vals
-                ]
-            )
-        )
-        tile.data[self.node_lookup["agency_nodeid"]] = list(
-            set(
-                [
-                    i
-                    for i in tile.data[self.node_lookup["agency_nodeid"]]
-                    if i in self.valid_management_agency_vals
-                ]
-            )
-        )
+    depth = getattr(_management_area_join, "deferred", 0)
+    _management_area_join.deferred = depth + 1
+    try:
+        yield
+    finally:
+        _management_area_join.deferred = depth
 
-        tile.save(
-            index=False,
-            #   edit_log_entry=False
-        )
 
-    def apply_fpan_region_and_county_attributes(
-        self, resourceinstance: ResourceInstance
-    ):
+def management_area_join_is_deferred():
+    return getattr(_management_area_join, "deferred", 0) > 0
 
-        tile = self.get_management_tile(resourceinstance)
 
-        if TYPE_CHECKING and not tile.data:
-            return
+def join_management_area_changes(
+    added=(), changed=None, removed=None, index: bool = True
+) -> List[str]:
+    """
+    Runs SpatialJoin.update_for_area_changes() for each resource graph, using a
+    single joiner per graph. Returns the ids of all changed resources.
+    """
 
-        siteid = get_node_value(resourceinstance, "FMSF ID")
-        if not siteid:
-            logger.warning(f"missing FSMF site id on resource: {resourceinstance.pk}")
-            return
+    resourceids = []
+    for graph in settings.GRAPH_LOOKUP.values():
+        if "spatial_node_lookup" not in graph:
+            continue
+        joiner = SpatialJoin(graph["name"])
+        resourceids += joiner.update_for_area_changes(
+            added=added, changed=changed, removed=removed, index=index
+        )
+    return resourceids
 
-        abbrev = siteid["en"]["value"][:2].upper()
-        entry = self.county_lookup.get(abbrev)
-        if not entry:
-            logger.warning(
-                f"no entry in county lookup for {abbrev}: {resourceinstance.pk}"
-            )
-            return
 
-        tile.data[self.node_lookup["county_nodeid"]].append(
-            entry["county_concept_value_id"]
-        )
-        tile.data[self.node_lookup["region_nodeid"]].append(
-            entry["region_concept_value_id"]
-        )
+def update_management_projection(resourceids, nodegroupid=None):
+    """
+    Rewrites the ResourceManagementArea and ResourceManagementAgency rows for
+    the given resources from the area and agency values in their management
+    tiles. Pass the nodegroupid of the saved tile to only read that graph's
+    management tiles.
+    """
 
-        # finalize with some QA/QC
-        tile.data[self.node_lookup["county_nodeid"]] = list(
-            set(
-                [
-                    i
-                    for i in tile.data[self.node_lookup["county_nodeid"]]
-                    if i in legal_value_ids
-                ]
-            )
-        )
-        tile.data[self.node_lookup["region_nodeid"]] = list(
-            set(
-                [
-                    i
-                    for i in tile.data[self.node_lookup["region_nodeid"]]
-                    if i in legal_value_ids
-                ]
-            )
-        )
+    resourceids = [str(i) for i in resourceids]
+    if len(resourceids) == 0:
+        return
 
-        tile.save(
-            index=False,
-            # edit_log_entry=False
+    lookups = [
+        i["spatial_node_lookup"]
+        for i in settings.GRAPH_LOOKUP.values()
+        if "spatial_node_lookup" in i
+    ]
+    if nodegroupid is not None:
+        lookups = [i for i in lookups if i["nodegroupid"] == str(nodegroupid)]
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            """DELETE FROM hms_resourcemanagementarea
+            WHERE resourceinstanceid = ANY(%(resourceids)s::uuid[]);
+            DELETE FROM hms_resourcemanagementagency
+            WHERE resourceinstanceid = ANY(%(resourceids)s::uuid[]);""",
+            {"resourceids": resourceids},
         )
+        for lookup in lookups:
+            params = {
+                "area_nodeid": lookup["area_nodeid"],
+                "agency_nodeid": lookup["agency_nodeid"],
+                "nodegroupid": lookup["nodegroupid"],
+                "resourceids": resourceids,
+            }
+            cursor.execute(
+                """INSERT INTO hms_resourcemanagementarea (resourceinstanceid, area_id)
+                SELECT DISTINCT t.resourceinstanceid, ma.id FROM tiles t
+                CROSS JOIN LATERAL jsonb_array_elements_text(
+                    CASE jsonb_typeof(t.tiledata -> %(area_nodeid)s)
+                        WHEN 'array' THEN t.tiledata -> %(area_nodeid)s
+                        ELSE '[]'::jsonb
+                    END
+                ) AS v(val)
+                JOIN "values" av ON av.valueid::text = v.val
+                JOIN hms_managementarea ma ON ma.concept_id = av.conceptid
+                WHERE t.nodegroupid = %(nodegroupid)s
+                    AND t.resourceinstanceid = ANY(%(resourceids)s::uuid[]);
+
+                INSERT INTO hms_resourcemanagementagency (resourceinstanceid, agency_id)
+                SELECT DISTINCT t.resourceinstanceid, ag.code FROM tiles t
+                CROSS JOIN LATERAL jsonb_array_elements_text(
+                    CASE jsonb_typeof(t.tiledata -> %(agency_nodeid)s)
+                        WHEN 'array' THEN t.tiledata -> %(agency_nodeid)s
+                        ELSE '[]'::jsonb
+                    END
+                ) AS v(val)
+                JOIN "values" av ON av.valueid::text = v.val
+                JOIN hms_managementagency ag ON ag.concept_id = av.conceptid
+                WHERE t.nodegroupid = %(nodegroupid)s
+                    AND t.resourceinstanceid = ANY(%(resourceids)s::uuid[]);""",
+                params,
+            )
 
 
 def get_node_value(resource, node_name):
@@ -1,25 +1,28 @@
 from __future__ import annotations
 import logging
-from django.core.cache import cache
 from django.http import (
     Http404,
     HttpResponse,
 )
-from django.db import connection
 from django.db.utils import IntegrityError
 from arches.app.models import models
 from arches.app.views.api import APIBase
 from arches.app.models.system_settings import settings
 
 from fpan.search.components.rule_filter import RuleFilter
-from hms.permissions_backend import get_rule_by_graph
+from hms.permissions_backend import get_accessible_resource_set, get_rule_by_graph
+from fpan.utils import (
+    build_mvt_tile,
+    get_cluster_tile,
+    get_mvt_cache,
+    get_mvt_cache_key,
+    mark_cluster_pyramid_used,
+)
 
 logger = logging.getLogger(__name__)
 
 
 class MVT(APIBase):
-    EARTHCIRCUM = 40075016.6856
-    PIXELSPERTILE = 256
     EMPTY_TILE = HttpResponse(b"", content_type="application/x-protobuf")
 
     def get(self, request, nodeid, zoom, x, y):
@@ -37,191 +40,66 @@ class MVT(APIBase):
         except models.Node.DoesNotExist:
             raise Http404()
         config = node.config
-        cache_key = f"mvt_{nodeid}_{request.user.username}_{zoom}_{x}_{y}"
-        tile = cache.get(cache_key)
 
-        BUST_RESOURCE_LAYER_CACHE = True
-        if tile is None or BUST_RESOURCE_LAYER_CACHE is True:
-            ## disable the real postgis spatial query because it was slower (and more picky about the input geometry)
-            ## than just calling another geo query on ES and retrieving ids from
-            ## that. could use another look down the road...
-            # rules = SiteFilter().get_rules(request.user, str(node.graph_id))
-            # if rule.type == "geo_filter":
-            #     geom = rules["geometry"]
-            #     # ST_SetSRID({geom}, 4236)
-            #     resid_where = f"ST_Intersects(geom, ST_Transform('{geom}', 3857))"
+        rule = get_rule_by_graph(request.user, graphid=str(node.graph.pk))
+        if rule.type == "no_access":
+            return self.EMPTY_TILE
+
+        # tiles are cached by the signature of the user's rule, so all users with
+        # the same access (e.g. all full access users) share the same tiles
+        tile_cache = get_mvt_cache()
+        cache_key = None
+        if int(zoom) <= settings.MVT_CACHE_MAX_ZOOM:
+            cache_key = get_mvt_cache_key(nodeid, rule.signature, zoom, x, y)
+        tile = tile_cache.get(cache_key) if cache_key else None
+        if tile is not None:
+            return self.tile_response(tile)
+
+        ## disable the real postgis spatial query because it was slower (and more picky about the input geometry)
+        ## than just calling another geo query on ES and retrieving ids from
+        ## that. could use another look down the road...
+        # rules = SiteFilter().get_rules(request.user, str(node.graph_id))
+        # if rule.type == "geo_filter":
+        #     geom = rules["geometry"]
+        #     # ST_SetSRID({geom}, 4236)
+        #     resid_where = f"ST_Intersects(geom, ST_Transform('{geom}', 3857))"
 
-            query_params = {
-                "nodeid": nodeid,
-                "zoom": zoom,
-                "x": x,
-                "y": y,
-            }
+        # low zoom (clustered) tiles come from the precomputed pyramid for this
+        # rule, if there is one, and are otherwise built live
+        if int(zoom) <= int(config["clusterMaxZoom"]):
+            mark_cluster_pyramid_used(rule.signature)
+            tile = get_cluster_tile(nodeid, rule.signature, zoom, x, y)
 
-            rule = get_rule_by_graph(request.user, graphid=str(node.graph.pk))
-            full_access = False
-            if rule.type == "no_access":
-                return self.EMPTY_TILE
-            elif rule.type == "full_access":
-                full_access = True
-            else:
+        if tile is None:
+            resids, resource_set_id = None, None
+            if rule.type == "attribute_filter":
+                # restrict by a join against the materialized set for this rule
+                resource_set = get_accessible_resource_set(rule)
+                if not resource_set.members.exists():
+                    return self.EMPTY_TILE
+                resource_set_id = resource_set.pk
+            elif rule.type != "full_access":
                 resids = RuleFilter().get_resources_from_rule(rule, ids_only=True)
                 # if there are not sites this user can view, return and empty tile before
                 # creating a db connection
                 if len(resids) == 0:
                     return self.EMPTY_TILE
-                # otherwise, add the list of valid ids to query params to be used below
-                query_params["valid_resids"] = tuple(resids)
-
-            with connection.cursor() as cursor:
-                if int(zoom) <= int(config["clusterMaxZoom"]):
-                    arc = self.EARTHCIRCUM / ((1 << int(zoom)) * self.PIXELSPERTILE)
-                    # add some extra query_params to support clustering
-                    query_params["distance"] = arc * int(config["clusterDistance"])
-                    query_params["min_points"] = int(config["clusterMinPoints"])
 
-                    if full_access:
-                        # run the basic cluster request and return ALL resources
-                        cursor.execute(
-                            """WITH clusters(tileid, resourceinstanceid, nodeid, geom, cid)
-                            AS (
-                                SELECT m.*,
-                                ST_ClusterDBSCAN(geom, eps := %(distance)s, minpoints := %(min_points)s) over () AS cid
-                                FROM (
-                                    SELECT tileid,
-                                        resourceinstanceid,
-                                        nodeid,
-                                        geom
-                                    FROM geojson_geometries
-                                    WHERE nodeid = %(nodeid)s
-                                ) m
-                            )
-
-                            SELECT ST_AsMVT(
-                                tile,
-                                %(nodeid)s,
-                                4096,
-                                'geom',
-                                'id'
-                            ) FROM (
-                                SELECT resourceinstanceid::text,
-                                    row_number() over () as id,
-                                    1 as total,
-                                    ST_AsMVTGeom(
-                                        geom,
-                                        TileBBox(%(zoom)s, %(x)s, %(y)s, 3857)
-                                    ) AS geom,
-                                    '' AS extent
-                                FROM clusters
-                                WHERE cid is NULL
-                                UNION
-                                SELECT NULL as resourceinstanceid,
-                                    row_number() over () as id,
-                                    count(*) as total,
-                                    ST_AsMVTGeom(
-                                        ST_Centroid(
-                                            ST_Collect(geom)
-                                        ),
-                                        TileBBox(%(zoom)s, %(x)s, %(y)s, 3857)
-                                    ) AS geom,
-                                    ST_AsGeoJSON(
-                                        ST_Extent(geom)
-                                    ) AS extent
-                                FROM clusters
-                                WHERE cid IS NOT NULL
-                                GROUP BY cid
-                            ) as tile;""",
-                            query_params,
-                        )
-                    else:
-                        # if not full access, add a WHERE clause to only return resources in the valid_resids list
-                        cursor.execute(
-                            """WITH clusters(tileid, resourceinstanceid, nodeid, geom, cid)
-                            AS (
-                                SELECT m.*,
-                                ST_ClusterDBSCAN(geom, eps := %(distance)s, minpoints := %(min_points)s) over () AS cid
-                                FROM (
-                                    SELECT tileid,
-                                        resourceinstanceid,
-                                        nodeid,
-                                        geom
-                                    FROM geojson_geometries
-                                    WHERE nodeid = %(nodeid)s AND resourceinstanceid IN %(valid_resids)s
-                                ) m
-                            )
+            tile = build_mvt_tile(
+                nodeid,
+                zoom,
+                x,
+                y,
+                config,
+                resourceids=resids,
+                resource_set_id=resource_set_id,
+            )
 
-                            SELECT ST_AsMVT(
-                                tile,
-                                %(nodeid),
-                                4096,
-                                'geom',
-                                'id'
-                            ) FROM (
-                                SELECT resourceinstanceid::text,
-                                    row_number() over () as id,
-                                    1 as total,
-                                    ST_AsMVTGeom(
-                                        geom,
-                                        TileBBox(%(zoom)s, %(x)s, %(y)s, 3857)
-                                    ) AS geom,
-                                    '' AS extent
-                                FROM clusters
-                                WHERE cid is NULL
-                                UNION
-                                SELECT NULL as resourceinstanceid,
-                                    row_number() over () as id,
-                                    count(*) as total,
-                                    ST_AsMVTGeom(
-                                        ST_Centroid(
-                                            ST_Collect(geom)
-                                        ),
-                                        TileBBox(%(zoom)s, %(x)s, %(y)s, 3857)
-                                    ) AS geom,
-                                    ST_AsGeoJSON(
-                                        ST_Extent(geom)
-                                    ) AS extent
-                                FROM clusters
-                                WHERE cid IS NOT NULL
-                                GROUP BY cid
-                            ) AS tile;""",
-                            query_params,
-                        )
-                else:
-                    if full_access is True:
-                        # run the basic request and return ALL resources
-                        cursor.execute(
-                            """SELECT ST_AsMVT(tile, %(nodeid)s, 4096, 'geom', 'id') FROM (SELECT tileid,
-                                id,
-                                resourceinstanceid,
-                                nodeid,
-                                ST_AsMVTGeom(
-                                    geom,
-                                    TileBBox(%(zoom)s, %(x)s, %(y)s, 3857)
-                                ) AS geom,
-                                1 AS total
-                            FROM geojson_geometries
-                            WHERE nodeid = %(nodeid)s) AS tile;""",
-                            query_params,
-                        )
-                    else:
-                        # add a WHERE clause to only return resources in the valid_resids list
-                        cursor.execute(
-                            """SELECT ST_AsMVT(tile, %(nodeid)s, 4096, 'geom', 'id') FROM (SELECT tileid,
-                                id,
-                                resourceinstanceid,
-                                nodeid,
-                                ST_AsMVTGeom(
-                                    geom,
-                                    TileBBox(%(zoom)s, %(x)s, %(y)s, 3857)
-                                ) AS geom,
-                                1 AS total
-                            FROM geojson_geometries
-                            WHERE nodeid = %(nodeid)s AND resourceinstanceid IN %(valid_resids)s) AS tile;""",
-                            query_params,
-                        )
-                tile = bytes(cursor.fetchone()[0])
-                cache.set(cache_key, tile, settings.TILE_CACHE_TIMEOUT)
+        if cache_key:
+            tile_cache.set(cache_key, tile, settings.TILE_CACHE_TIMEOUT)
+        return self.tile_response(tile)
 
+    def tile_response(self, tile):
         if not len(tile):
             return self.EMPTY_TILE
         return HttpResponse(tile, content_type="application/x-protobuf")
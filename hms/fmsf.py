@@ -9,7 +9,6 @@ import copy
 import uuid
 
 from django.contrib.gis.gdal.feature import Feature
-from django.db import connection
 
 from arches.app.utils.betterJSONSerializer import JSONSerializer
 
@@ -19,6 +18,15 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 
+def get_feature_siteid(feature: Union[Feature, dict]) -> Union[str, None]:
+    """Returns the SITEID of a shapefile feature (or a dict record of it),
+    without the trailing spaces that the FMSF exports pad it with. All lookups
+    by SITEID during an import are keyed by this value."""
+
+    siteid = feature.get("SITEID")
+    return siteid.rstrip() if siteid else siteid
+
+
 # class FMSFResource:
 #     """A wrapper class around an Arches resource that helps manage FMSF content"""
 
@@ -47,13 +55,20 @@ class FMSFResource:
     siteid: Union[str, None]
     resource: Union[Resource, None]
     resourceid: str
-    feature: Feature
-    parent_tile_lookup: dict = {}
+    feature: Union[Feature, dict]
+    parent_tile_lookup: dict
+
+    def __init__(self):
+        # parent tiles are created once per resource, so this must not be
+        # shared between instances
+        self.parent_tile_lookup = {}
 
     @staticmethod
-    def from_shp_feature(feature: Feature) -> "FMSFResource":
+    def from_shp_feature(feature: Union[Feature, dict]) -> "FMSFResource":
+        """Accepts a GDAL feature, or a dict record of its fields (as used by the
+        parallel tile generation in FMSFImporter)."""
 
-        siteid = feature.get("SITEID")
+        siteid = get_feature_siteid(feature)
         if not siteid:
             raise Exception("bad shapefile feature: missing or empty SITEID field")
         res = FMSFResource()
@@ -118,17 +133,11 @@ class FMSFResource:
                 )
             else:
                 if fieldset[0]["field"] == "geom":
-                    geom = self.feature.geom
-                    with connection.cursor() as cursor:
-                        cursor.execute(
-                            f"SELECT ST_AsGeoJSON( ST_RemoveRepeatedPoints( ST_MakeValid('{geom.wkt}')));"
-                        )
-                        result = cursor.fetchone()
-                        if not result:
-                            logger.warning("Error sanitizing geometry for tile.")
-                            continue
-                        geojson = result[0]
-                    source_value = geojson
+                    # geometries are sanitized in bulk before tiles are generated
+                    source_value = importer.geojson_lookup.get(self.siteid)
+                    if source_value is None:
+                        logger.warning("Error sanitizing geometry for tile.")
+                        continue
                 else:
                     source_value = self.feature.get(fieldset[0]["field"])
                 value = datatype_instance.transform_value_for_tile(
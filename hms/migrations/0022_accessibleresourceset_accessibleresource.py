@@ -0,0 +1,65 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hms", "0021_alter_managementareagroup_note"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AccessibleResourceSet",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("signature", models.CharField(max_length=40, unique=True)),
+                ("graph_id", models.UUIDField()),
+                ("nodegroup_id", models.UUIDField(db_index=True)),
+                ("rule", models.JSONField()),
+                ("last_built", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Accessible Resource Set",
+                "verbose_name_plural": "Accessible Resource Sets",
+            },
+        ),
+        migrations.CreateModel(
+            name="AccessibleResource",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("resourceinstanceid", models.UUIDField(db_index=True)),
+                (
+                    "resource_set",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="members",
+                        to="hms.accessibleresourceset",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Accessible Resource",
+                "verbose_name_plural": "Accessible Resources",
+                "unique_together": {("resource_set", "resourceinstanceid")},
+            },
+        ),
+    ]
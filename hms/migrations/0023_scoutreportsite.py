@@ -0,0 +1,56 @@
+# Generated by Django 4.2.16 on 2026-10-18 10:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_scout_report_sites(apps, schema_editor):
+
+    # the Scout Report graph won't exist yet on a fresh database, in which
+    # case the index is filled as reports are created.
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            """INSERT INTO hms_scoutreportsite (tileid, reportid, siteid)
+            SELECT t.tileid,
+                t.resourceinstanceid,
+                (t.tiledata -> n.nodeid::text -> 0 ->> 'resourceId')::uuid
+            FROM tiles t
+            JOIN nodes n ON n.nodegroupid = t.nodegroupid
+            WHERE n.name = 'FMSF Site ID'
+                AND n.graphid = %s
+                AND jsonb_typeof(t.tiledata -> n.nodeid::text) = 'array'
+                AND t.tiledata -> n.nodeid::text -> 0 ->> 'resourceId' IS NOT NULL;""",
+            [settings.GRAPH_LOOKUP["sr"]["id"]],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hms", "0022_accessibleresourceset_accessibleresource"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScoutReportSite",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("tileid", models.UUIDField(db_index=True)),
+                ("reportid", models.UUIDField(db_index=True)),
+                ("siteid", models.UUIDField(db_index=True)),
+            ],
+            options={
+                "verbose_name": "Scout Report Site",
+                "verbose_name_plural": "Scout Report Sites",
+            },
+        ),
+        migrations.RunPython(populate_scout_report_sites, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hms", "0023_scoutreportsite"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ClusterPyramid",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("nodeid", models.UUIDField()),
+                ("signature", models.CharField(max_length=40)),
+                ("max_zoom", models.IntegerField()),
+                ("stale", models.BooleanField(default=True)),
+                ("last_built", models.DateTimeField(auto_now=True)),
+                (
+                    "resource_set",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="hms.accessibleresourceset",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Cluster Pyramid",
+                "verbose_name_plural": "Cluster Pyramids",
+                "unique_together": {("nodeid", "signature")},
+            },
+        ),
+        migrations.CreateModel(
+            name="ClusterTile",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("zoom", models.IntegerField()),
+                ("x", models.IntegerField()),
+                ("y", models.IntegerField()),
+                ("tile", models.BinaryField()),
+                (
+                    "pyramid",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="tiles",
+                        to="hms.clusterpyramid",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Cluster Tile",
+                "verbose_name_plural": "Cluster Tiles",
+                "unique_together": {("pyramid", "zoom", "x", "y")},
+            },
+        ),
+    ]
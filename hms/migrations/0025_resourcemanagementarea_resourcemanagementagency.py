@@ -0,0 +1,115 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_management_projection(apps, schema_editor):
+
+    # the site graphs won't exist yet on a fresh database, in which case the
+    # tables are filled as the spatial join writes management tiles.
+    with schema_editor.connection.cursor() as cursor:
+        for graph in settings.GRAPH_LOOKUP.values():
+            if "spatial_node_lookup" not in graph:
+                continue
+            lookup = graph["spatial_node_lookup"]
+            cursor.execute(
+                """INSERT INTO hms_resourcemanagementarea (resourceinstanceid, area_id)
+                SELECT DISTINCT t.resourceinstanceid, ma.id FROM tiles t
+                CROSS JOIN LATERAL jsonb_array_elements_text(
+                    CASE jsonb_typeof(t.tiledata -> %(nodeid)s)
+                        WHEN 'array' THEN t.tiledata -> %(nodeid)s
+                        ELSE '[]'::jsonb
+                    END
+                ) AS v(val)
+                JOIN "values" av ON av.valueid::text = v.val
+                JOIN hms_managementarea ma ON ma.concept_id = av.conceptid
+                WHERE t.nodegroupid = %(nodegroupid)s;""",
+                {
+                    "nodeid": lookup["area_nodeid"],
+                    "nodegroupid": lookup["nodegroupid"],
+                },
+            )
+            cursor.execute(
+                """INSERT INTO hms_resourcemanagementagency (resourceinstanceid, agency_id)
+                SELECT DISTINCT t.resourceinstanceid, ag.code FROM tiles t
+                CROSS JOIN LATERAL jsonb_array_elements_text(
+                    CASE jsonb_typeof(t.tiledata -> %(nodeid)s)
+                        WHEN 'array' THEN t.tiledata -> %(nodeid)s
+                        ELSE '[]'::jsonb
+                    END
+                ) AS v(val)
+                JOIN "values" av ON av.valueid::text = v.val
+                JOIN hms_managementagency ag ON ag.concept_id = av.conceptid
+                WHERE t.nodegroupid = %(nodegroupid)s;""",
+                {
+                    "nodeid": lookup["agency_nodeid"],
+                    "nodegroupid": lookup["nodegroupid"],
+                },
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hms", "0024_clusterpyramid_clustertile"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResourceManagementArea",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("resourceinstanceid", models.UUIDField(db_index=True)),
+                (
+                    "area",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="hms.managementarea",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Resource Management Area",
+                "verbose_name_plural": "Resource Management Areas",
+                "unique_together": {("resourceinstanceid", "area")},
+            },
+        ),
+        migrations.CreateModel(
+            name="ResourceManagementAgency",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("resourceinstanceid", models.UUIDField(db_index=True)),
+                (
+                    "agency",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="hms.managementagency",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Resource Management Agency",
+                "verbose_name_plural": "Resource Management Agencies",
+                "unique_together": {("resourceinstanceid", "agency")},
+            },
+        ),
+        migrations.RunPython(populate_management_projection, migrations.RunPython.noop),
+    ]
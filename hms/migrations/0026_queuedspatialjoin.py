@@ -0,0 +1,34 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hms", "0025_resourcemanagementarea_resourcemanagementagency"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QueuedSpatialJoin",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("resourceinstanceid", models.UUIDField(unique=True)),
+                ("graph_id", models.UUIDField()),
+                ("queued", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Queued Spatial Join",
+                "verbose_name_plural": "Queued Spatial Joins",
+            },
+        ),
+    ]
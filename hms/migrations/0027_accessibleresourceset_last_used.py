@@ -0,0 +1,21 @@
+# Generated by Django 4.2.16 on 2026-10-18 16:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("hms", "0026_queuedspatialjoin"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="accessibleresourceset",
+            name="last_used",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+    ]
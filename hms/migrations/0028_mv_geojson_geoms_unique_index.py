@@ -0,0 +1,58 @@
+# Generated by Django 4.2.16 on 2026-10-18 16:40
+
+from django.db import migrations
+
+# same as the view in arches' 5475_update_geom_mv migration, with the position
+# of each feature in its tile, so that every row has a unique key. REFRESH
+# MATERIALIZED VIEW CONCURRENTLY requires a unique index.
+CREATE_VIEW = """
+DROP MATERIALIZED VIEW IF EXISTS mv_geojson_geoms;
+CREATE MATERIALIZED VIEW mv_geojson_geoms AS
+    SELECT t.tileid,
+        t.resourceinstanceid,
+        n.nodeid,
+        f.feature_index,
+        ST_Transform(ST_SetSRID(
+            ST_GeomFromGeoJSON((f.feature -> 'geometry')::text), 4326
+        ), 3857) AS geom
+    FROM tiles t
+    LEFT JOIN nodes n ON t.nodegroupid = n.nodegroupid
+    CROSS JOIN LATERAL json_array_elements(
+        t.tiledata::json -> n.nodeid::text -> 'features'
+    ) WITH ORDINALITY AS f(feature, feature_index)
+    WHERE n.datatype = 'geojson-feature-collection'::text;
+
+CREATE INDEX mv_geojson_geoms_gix ON mv_geojson_geoms USING GIST (geom);
+CREATE UNIQUE INDEX mv_geojson_geoms_feature_idx
+    ON mv_geojson_geoms (tileid, nodeid, feature_index);
+"""
+
+REVERT_VIEW = """
+DROP MATERIALIZED VIEW IF EXISTS mv_geojson_geoms;
+CREATE MATERIALIZED VIEW mv_geojson_geoms AS
+    SELECT t.tileid,
+        t.resourceinstanceid,
+        n.nodeid,
+        ST_Transform(ST_SetSRID(
+            ST_GeomFromGeoJSON(
+                (json_array_elements(
+                    t.tiledata::json -> n.nodeid::text -> 'features'
+                ) -> 'geometry')::text
+            ), 4326
+        ), 3857) AS geom
+    FROM tiles t
+    LEFT JOIN nodes n ON t.nodegroupid = n.nodegroupid
+    WHERE n.datatype = 'geojson-feature-collection'::text;
+
+CREATE INDEX mv_geojson_geoms_gix ON mv_geojson_geoms USING GIST (geom);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("models", "5475_update_geom_mv"),
+        ("hms", "0027_accessibleresourceset_last_used"),
+    ]
+
+    operations = [migrations.RunSQL(CREATE_VIEW, REVERT_VIEW)]
@@ -14,6 +14,7 @@ from django.contrib.gis.db import models
 from django.contrib.auth.models import User
 from django.contrib.postgres.fields import ArrayField
 from django.contrib.gis.geos import MultiPolygon
+from django.utils import timezone
 from django.utils.safestring import mark_safe, SafeText
 from django.db import connection
 
@@ -360,17 +361,77 @@ def get_or_create_concept(label, parent_lbl, collection_lbl, concept_id=None):
     return concept
 
 
-def get_concept_value_id(concept):
-    try:
-        return str(
-            Value.objects.get(
-                concept=concept,
-                language_id="en",
-                valuetype_id="prefLabel",
-            ).pk
+## process-wide lookup of concept id to the id of its English prefLabel value,
+## for the concepts of all management areas and agencies, along with the RDM
+## cache version it was built under. It is filled with a single query on first
+## use, and rebuilt when the RDM cache version changes (which happens in every
+## process when a concept value is created or edited).
+_concept_value_ids = (None, {})
+
+
+def clear_concept_value_id_cache():
+    global _concept_value_ids
+
+    _concept_value_ids = (None, {})
+
+
+def _load_concept_value_ids() -> dict:
+
+    concept_ids = list(
+        ManagementArea.objects.exclude(concept=None).values_list(
+            "concept_id", flat=True
         )
-    except Value.DoesNotExist:
+    ) + list(
+        ManagementAgency.objects.exclude(concept=None).values_list(
+            "concept_id", flat=True
+        )
+    )
+    return _query_concept_value_ids(concept_ids)
+
+
+def _query_concept_value_ids(concept_ids) -> dict:
+
+    values = Value.objects.filter(
+        concept_id__in=concept_ids,
+        language_id="en",
+        valuetype_id="prefLabel",
+    ).values_list("concept_id", "pk")
+    lookup = {}
+    for concept_id, value_id in values:
+        lookup.setdefault(str(concept_id), str(value_id))
+    return lookup
+
+
+def get_concept_value_ids(concepts) -> dict:
+    """Returns a dict of concept id to prefLabel value id for all of the given
+    concepts (or concept ids), with a single query for any that are not in the
+    lookup yet. Concepts with no value are left out."""
+    from fpan.utils import get_rdm_cache_version
+
+    global _concept_value_ids
+
+    version = get_rdm_cache_version()
+    if _concept_value_ids[0] != version:
+        _concept_value_ids = (version, _load_concept_value_ids())
+    lookup = _concept_value_ids[1]
+
+    concept_ids = [
+        str(i.pk if isinstance(i, Concept) else i) for i in concepts if i is not None
+    ]
+    # misses are not held, so a value created later will still be found
+    missing = [i for i in concept_ids if i not in lookup]
+    if missing:
+        lookup.update(_query_concept_value_ids(missing))
+
+    return {i: lookup[i] for i in concept_ids if i in lookup}
+
+
+def get_concept_value_id(concept):
+
+    if concept is None:
         return None
+    concept_id = str(concept.pk if isinstance(concept, Concept) else concept)
+    return get_concept_value_ids([concept_id]).get(concept_id)
 
 
 class ManagementAgency(models.Model):
@@ -400,7 +461,7 @@ class ManagementAgency(models.Model):
 
     @property
     def concept_value_id(self):
-        return get_concept_value_id(self.concept)
+        return get_concept_value_id(self.concept_id)
 
     def save(self, *args, **kwargs):
 
@@ -411,11 +472,13 @@ class ManagementAgency(models.Model):
                 collection_lbl="Management Agencies",
             )
 
+        clear_concept_value_id_cache()
         return super(ManagementAgency, self).save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
         if self.concept:
             self.concept.delete()
+        clear_concept_value_id_cache()
         return super(ManagementAgency, self).delete(*args, **kwargs)
 
 
@@ -493,7 +556,7 @@ class ManagementArea(models.Model):
 
     @property
     def concept_value_id(self):
-        return get_concept_value_id(self.concept)
+        return get_concept_value_id(self.concept_id)
 
     def get_intersecting_resource_ids(self) -> List[str]:
         if self.geom:
@@ -531,11 +594,13 @@ class ManagementArea(models.Model):
             )
             self.concept = concept
 
+        clear_concept_value_id_cache()
         return super(ManagementArea, self).save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
         if self.concept:
             self.concept.delete()
+        clear_concept_value_id_cache()
         return super(ManagementArea, self).delete(*args, **kwargs)
 
 
@@ -562,3 +627,133 @@ class FPANRegion(models.Model):
 
     def __str__(self):
         return self.name if self.name else f"FPAN Region ({self.pk})"
+
+
+class AccessibleResourceSet(models.Model):
+    """The materialized result of an attribute_filter Rule. There is one set per
+    rule signature, so all users with an identical rule share it. Member ids are
+    held in AccessibleResource and are refreshed incrementally when the tiles in
+    the rule's nodegroup are saved (see fpan.signals). Sets that have not been
+    used for a while are pruned (see prune_accessible_resource_sets())."""
+
+    class Meta:
+        verbose_name = "Accessible Resource Set"
+        verbose_name_plural = "Accessible Resource Sets"
+
+    signature = models.CharField(max_length=40, unique=True)
+    graph_id = models.UUIDField()
+    nodegroup_id = models.UUIDField(db_index=True)
+    rule = models.JSONField()
+    last_built = models.DateTimeField(auto_now=True)
+    last_used = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.rule.get('type')} | {self.signature}"
+
+
+class AccessibleResource(models.Model):
+    class Meta:
+        verbose_name = "Accessible Resource"
+        verbose_name_plural = "Accessible Resources"
+        unique_together = ("resource_set", "resourceinstanceid")
+
+    resource_set = models.ForeignKey(
+        AccessibleResourceSet, related_name="members", on_delete=models.CASCADE
+    )
+    resourceinstanceid = models.UUIDField(db_index=True)
+
+
+class ScoutReportSite(models.Model):
+    """Reverse index from site resources to the Scout Reports that reference
+    them, with one row per FMSF Site ID tile. As in the rest of the permissions
+    logic, only the first site referenced in the tile is used. It is maintained
+    by signals on Tile save/delete (see fpan.signals)."""
+
+    class Meta:
+        verbose_name = "Scout Report Site"
+        verbose_name_plural = "Scout Report Sites"
+
+    tileid = models.UUIDField(db_index=True)
+    reportid = models.UUIDField(db_index=True)
+    siteid = models.UUIDField(db_index=True)
+
+
+class ClusterPyramid(models.Model):
+    """Precomputed MVT tiles for a geometry node at every zoom up to the node's
+    clusterMaxZoom, for one access rule signature (full access to the graph, or
+    an AccessibleResourceSet). Pyramids are marked stale whenever all MVT tiles
+    are invalidated, and are not used again until they are rebuilt."""
+
+    class Meta:
+        verbose_name = "Cluster Pyramid"
+        verbose_name_plural = "Cluster Pyramids"
+        unique_together = ("nodeid", "signature")
+
+    nodeid = models.UUIDField()
+    signature = models.CharField(max_length=40)
+    resource_set = models.ForeignKey(
+        AccessibleResourceSet, null=True, blank=True, on_delete=models.CASCADE
+    )
+    max_zoom = models.IntegerField()
+    stale = models.BooleanField(default=True)
+    last_built = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.nodeid} | {self.signature}"
+
+
+class ClusterTile(models.Model):
+    class Meta:
+        verbose_name = "Cluster Tile"
+        verbose_name_plural = "Cluster Tiles"
+        unique_together = ("pyramid", "zoom", "x", "y")
+
+    pyramid = models.ForeignKey(
+        ClusterPyramid, related_name="tiles", on_delete=models.CASCADE
+    )
+    zoom = models.IntegerField()
+    x = models.IntegerField()
+    y = models.IntegerField()
+    tile = models.BinaryField()
+
+
+class ResourceManagementArea(models.Model):
+    """Projection of the management areas held in each resource's management
+    tile, with one row per resource and area. It is kept current by signals on
+    Tile save/delete (see fpan.signals), so whatever the spatial join writes is
+    reflected here, and is used to evaluate AREA access rules in SQL."""
+
+    class Meta:
+        verbose_name = "Resource Management Area"
+        verbose_name_plural = "Resource Management Areas"
+        unique_together = ("resourceinstanceid", "area")
+
+    resourceinstanceid = models.UUIDField(db_index=True)
+    area = models.ForeignKey(ManagementArea, on_delete=models.CASCADE)
+
+
+class ResourceManagementAgency(models.Model):
+    """As ResourceManagementArea, for the management agencies on each resource.
+    Used to evaluate AGENCY access rules."""
+
+    class Meta:
+        verbose_name = "Resource Management Agency"
+        verbose_name_plural = "Resource Management Agencies"
+        unique_together = ("resourceinstanceid", "agency")
+
+    resourceinstanceid = models.UUIDField(db_index=True)
+    agency = models.ForeignKey(ManagementAgency, on_delete=models.CASCADE)
+
+
+class QueuedSpatialJoin(models.Model):
+    """A resource whose geometry has changed and which is waiting for the
+    spatial join. The queue is processed in batches by a celery task (see
+    fpan.tasks.run_queued_spatial_joins)."""
+
+    class Meta:
+        verbose_name = "Queued Spatial Join"
+        verbose_name_plural = "Queued Spatial Joins"
+
+    resourceinstanceid = models.UUIDField(unique=True)
+    graph_id = models.UUIDField()
+    queued = models.DateTimeField(auto_now=True)
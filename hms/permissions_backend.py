@@ -1,16 +1,26 @@
 import time
 import logging
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
 
 from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction, IntegrityError
+from django.utils import timezone
 
-from arches.app.models.models import Node
-from arches.app.models.resource import Resource
-from arches.app.models.tile import Tile
+from arches.app.models.models import Node, ResourceInstance
 
 from fpan.search.components.rule_filter import Rule, RuleFilter
 
 logger = logging.getLogger(__name__)
 
+RULE_CACHE_VERSION_KEY = "hms_rule_cache_version"
+RESOURCE_SET_NODEGROUPS_KEY = "hms_resource_set_nodegroups"
+
+_resource_refresh = threading.local()
+
 
 def user_is_land_manager(user):
     return hasattr(user, "landmanager")
@@ -41,11 +51,12 @@ def get_archaeological_site_rule(user) -> Rule:
             #   geometry=multipolygon,
             # )
 
-            ## instead, apply attribute rule based on the names of
+            ## instead, apply attribute rule based on the names and ids of
             ## of associated areas.
             value = ["<no area set>"]
-            if len(user.landmanager.all_areas) > 0:
-                value = [f"{i.name} ({i.pk})" for i in user.landmanager.all_areas]
+            areas = list(user.landmanager.all_areas)
+            if len(areas) > 0:
+                value = [f"{i.name} ({i.pk})" for i in areas]
             rule = Rule(
                 "attribute_filter",
                 graph_id=arch_graphid,
@@ -53,12 +64,14 @@ def get_archaeological_site_rule(user) -> Rule:
                     "area_nodeid"
                 ],
                 value=value,
+                area_ids=[i.pk for i in areas],
             )
 
         elif user.landmanager.site_access_mode == "AGENCY":
-            value = ["<no agency set>"]
+            value, agency_codes = ["<no agency set>"], []
             if user.landmanager.management_agency:
                 value = [user.landmanager.management_agency.name]
+                agency_codes = [user.landmanager.management_agency.pk]
 
             rule = Rule(
                 "attribute_filter",
@@ -67,8 +80,9 @@ def get_archaeological_site_rule(user) -> Rule:
                     "agency_nodeid"
                 ],
                 value=value,
+                agency_codes=agency_codes,
             )
-        elif user.site_access_mode == "NONE":
+        elif user.landmanager.site_access_mode == "NONE":
             rule = Rule("no_access", graph_id=arch_graphid)
         else:
             rule = Rule("no_access", graph_id=arch_graphid)
@@ -100,58 +114,99 @@ def get_archaeological_site_rule(user) -> Rule:
 def get_scout_report_rule(user) -> Rule:
 
     report_graphid = settings.GRAPH_LOOKUP["sr"]["id"]
-    arch_rule = get_archaeological_site_rule(user)
+    arch_rule = get_cached_archaeological_site_rule(user)
 
     start = time.time()
 
     if arch_rule.type == "full_access":
         return Rule("full_access", graph_id=report_graphid)
-    elif arch_rule.type == "no_access":
-        arch_ids = []
-    else:
-        ## get ids only for the sites this user has access to
-        arch_ids = RuleFilter().get_resources_from_rule(arch_rule, ids_only=True)
-
-    ## now add all ids for all Historic Cemeteries and Historic Structures
-    cem_ids = list(
-        Resource.objects.filter(
-            graph__pk=settings.GRAPH_LOOKUP["hc"]["id"]
-        ).values_list("pk", flat=True)
-    )
-    struct_ids = list(
-        Resource.objects.filter(
-            graph__pk=settings.GRAPH_LOOKUP["hs"]["id"]
-        ).values_list("pk", flat=True)
-    )
-
-    resids = [str(i) for i in arch_ids + cem_ids + struct_ids]
 
-    siteid_node = Node.objects.get(name="FMSF Site ID", graph__pk=report_graphid)
-    siteid_nodeid = str(siteid_node.pk)
-    rep_datas = Tile.objects.filter(nodegroup=siteid_node.nodegroup).values(
-        "data", "resourceinstance_id"
-    )
-    reportids = []
-    for rd in rep_datas:
-        try:
-            fmsfid = rd["data"][siteid_nodeid][0]["resourceId"]
-            if fmsfid in resids:
-                reportids.append(str(rd["resourceinstance_id"]))
-        except (IndexError, KeyError, TypeError) as e:
-            logger.warning(f"can't get fmsf id from {rd['resourceinstance_id']}")
-            logger.warning(e)
-        except Exception as e:
-            logger.error(f"can't get fmsf id from {rd['resourceinstance_id']}")
-            logger.error(e)
+    ## reports on any Historic Cemetery or Historic Structure are allowed, as
+    ## well as reports on the sites in this user's accessible resource set.
+    params = {
+        "open_graphids": [
+            settings.GRAPH_LOOKUP["hc"]["id"],
+            settings.GRAPH_LOOKUP["hs"]["id"],
+        ],
+        "resource_set_id": None,
+    }
+    if arch_rule.type == "attribute_filter":
+        params["resource_set_id"] = get_accessible_resource_set(arch_rule).pk
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """SELECT DISTINCT srs.reportid FROM hms_scoutreportsite srs
+            JOIN resource_instances ri ON ri.resourceinstanceid = srs.siteid
+            WHERE ri.graphid = ANY(%(open_graphids)s::uuid[])
+                OR EXISTS (
+                    SELECT 1 FROM hms_accessibleresource ar
+                    WHERE ar.resource_set_id = %(resource_set_id)s
+                        AND ar.resourceinstanceid = srs.siteid
+                );""",
+            params,
+        )
+        reportids = [str(i[0]) for i in cursor.fetchall()]
 
     logger.debug(f"get_scout_report_rule: {time.time() - start}")
     return Rule("resourceid_filter", resourceids=reportids)
 
 
+def _get_rule_cache_version():
+
+    version = cache.get(RULE_CACHE_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        cache.add(RULE_CACHE_VERSION_KEY, version, None)
+        version = cache.get(RULE_CACHE_VERSION_KEY, version)
+    return version
+
+
+def get_rule_cache_key(user, graphid):
+    """Returns the cache key for a user's rule on the given graph, or None if
+    the user is not a saved User (e.g. Django's AnonymousUser)."""
+
+    if not isinstance(user, User) or user.pk is None:
+        return None
+    return f"hms_rule_{_get_rule_cache_version()}_{user.pk}_{graphid}"
+
+
+def clear_rule_cache(user=None):
+    """Invalidate cached rules. If a user is passed only that user's rules are
+    removed, otherwise the cache version is changed so that every cached rule
+    becomes stale at once."""
+
+    if user is None:
+        cache.set(RULE_CACHE_VERSION_KEY, time.time_ns(), None)
+        return
+
+    keys = [
+        get_rule_cache_key(user, graph["id"])
+        for graph in settings.GRAPH_LOOKUP.values()
+    ]
+    cache.delete_many([i for i in keys if i is not None])
+
+
+def get_cached_archaeological_site_rule(user) -> Rule:
+    """Building the Archaeological Site rule requires a few ORM queries (node
+    lookup, management area unions) and it is needed by every search, MVT tile,
+    and decorated view, so the result is cached per user. The cache is cleared
+    by signals in hms.signals whenever the inputs to the rule change."""
+
+    cache_key = get_rule_cache_key(user, settings.GRAPH_LOOKUP["as"]["id"])
+    if cache_key is None:
+        return get_archaeological_site_rule(user)
+
+    rule = cache.get(cache_key)
+    if rule is None:
+        rule = get_archaeological_site_rule(user)
+        cache.set(cache_key, rule, settings.RULE_CACHE_TIMEOUT)
+    return rule
+
+
 def get_rule_by_graph(user, graphid=None) -> Rule:
 
     if graphid == settings.GRAPH_LOOKUP["as"]["id"]:
-        return get_archaeological_site_rule(user)
+        return get_cached_archaeological_site_rule(user)
     elif graphid == settings.GRAPH_LOOKUP["sr"]["id"]:
         return get_scout_report_rule(user)
     else:
@@ -167,9 +222,407 @@ def get_user_allowed_resources_by_graph(user, graphid):
     return id_list
 
 
+def get_scout_report_site_node() -> dict:
+    """Returns the ids of the Scout Report "FMSF Site ID" node and its nodegroup."""
+
+    lookup = cache.get("hms_scout_report_site_node")
+    if lookup is None:
+        node = Node.objects.get(
+            name="FMSF Site ID", graph__pk=settings.GRAPH_LOOKUP["sr"]["id"]
+        )
+        lookup = {"nodeid": str(node.pk), "nodegroupid": str(node.nodegroup_id)}
+        cache.set("hms_scout_report_site_node", lookup, None)
+    return lookup
+
+
+def update_scout_report_site_index(tile, deleted=False):
+    """Updates the ScoutReportSite index for a single FMSF Site ID tile. Tiles
+    from any other nodegroup are ignored."""
+
+    from hms.models import ScoutReportSite
+
+    site_node = get_scout_report_site_node()
+    if str(tile.nodegroup_id) != site_node["nodegroupid"]:
+        return
+
+    ScoutReportSite.objects.filter(tileid=tile.tileid).delete()
+    if deleted or not tile.data:
+        return
+
+    try:
+        siteid = tile.data[site_node["nodeid"]][0]["resourceId"]
+    except (IndexError, KeyError, TypeError):
+        logger.warning(f"can't get fmsf id from {tile.resourceinstance_id}")
+        return
+    ScoutReportSite.objects.create(
+        tileid=tile.tileid, reportid=tile.resourceinstance_id, siteid=siteid
+    )
+
+
+def get_scout_report_site_ids(reportid) -> list:
+    """Returns the ids of the site resources referenced by a Scout Report."""
+
+    from hms.models import ScoutReportSite
+
+    site_ids = ScoutReportSite.objects.filter(reportid=reportid).values_list(
+        "siteid", flat=True
+    )
+    return [str(i) for i in site_ids]
+
+
+def user_can_access(user, resourceid, graphid=None) -> bool:
+    """Checks whether a user can access a single resource. Only that resource's
+    own tiles are evaluated against the user's rule, so the cost of this check
+    does not depend on how many resources the user has access to."""
+
+    start = time.time()
+
+    resourceid = str(resourceid)
+    if graphid is None:
+        try:
+            graphid = str(
+                ResourceInstance.objects.values_list("graph_id", flat=True).get(
+                    pk=resourceid
+                )
+            )
+        except ResourceInstance.DoesNotExist:
+            return False
+
+    ## a scout report is accessible if the site it references is accessible,
+    ## so check that site rather than compiling the full Scout Report rule.
+    if graphid == settings.GRAPH_LOOKUP["sr"]["id"]:
+        arch_rule = get_cached_archaeological_site_rule(user)
+        if arch_rule.type == "full_access":
+            return True
+        site_ids = get_scout_report_site_ids(resourceid)
+        return any([user_can_access(user, i) for i in site_ids])
+
+    rule = get_rule_by_graph(user, graphid=graphid)
+    if rule.type == "full_access":
+        allowed = True
+    elif rule.type == "no_access":
+        allowed = False
+    elif rule.type == "resourceid_filter":
+        allowed = resourceid in [str(i) for i in rule.config["resourceids"]]
+    elif rule.type == "attribute_filter":
+        allowed = len(evaluate_rule_for_resources(rule, resourceids=[resourceid])) > 0
+    else:
+        allowed = RuleFilter().resource_matches_rule(rule, resourceid)
+
+    logger.debug(f"user_can_access {allowed}: {time.time() - start}")
+    return allowed
+
+
+def get_rule_match_values(rule_config: dict, node: Node) -> list:
+    """attribute_filter rules hold display values (concept labels, usernames)
+    which Elasticsearch matches against the indexed strings. In tile data
+    concept and user nodes store ids instead, so translate the rule values
+    into those ids for use in SQL. String nodes store the display value
+    itself, so those are returned unchanged."""
+
+    labels = rule_config["value"]
+
+    if node.datatype in ("concept", "concept-list"):
+        collectionid = (node.config or {}).get("rdmCollection")
+        if not collectionid:
+            return []
+        ## only match labels within the node's own collection, the same
+        ## label may exist in many unrelated concept schemes.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """WITH RECURSIVE members(conceptid) AS (
+                    SELECT conceptidto FROM relations
+                    WHERE conceptidfrom = %(collectionid)s
+                        AND relationtype = 'member'
+                    UNION
+                    SELECT r.conceptidto FROM relations r
+                    JOIN members m ON r.conceptidfrom = m.conceptid
+                    WHERE r.relationtype = 'member'
+                )
+                SELECT v.valueid FROM "values" v
+                JOIN members m ON v.conceptid = m.conceptid
+                WHERE v.value = ANY(%(labels)s);""",
+                {"collectionid": collectionid, "labels": labels},
+            )
+            return [str(i[0]) for i in cursor.fetchall()]
+
+    if node.datatype == "user":
+        user_ids = User.objects.filter(username__in=labels).values_list("pk", flat=True)
+        return [str(i) for i in user_ids]
+
+    return [str(i) for i in labels]
+
+
+def evaluate_rule_for_resources(rule: Rule, resourceids=None) -> set:
+    """Returns the ids of resources that satisfy an attribute_filter rule, by
+    reading the rule's node directly from the tiles table. Pass a list of
+    resourceids to only test those resources, otherwise the whole nodegroup
+    is evaluated."""
+
+    if rule.type != "attribute_filter":
+        raise Exception(f"Can't evaluate {rule.type} rule against tile data.")
+
+    return evaluate_rule_config(rule.config, resourceids=resourceids)
+
+
+def evaluate_rule_config(rule_config: dict, resourceids=None) -> set:
+
+    if "area_ids" in rule_config or "agency_codes" in rule_config:
+        return evaluate_management_rule_config(rule_config, resourceids=resourceids)
+
+    try:
+        node = Node.objects.get(pk=rule_config["node_id"])
+    except Node.DoesNotExist:
+        logger.warning(f"rule node does not exist: {rule_config['node_id']}")
+        return set()
+
+    params = {
+        "nodeid": str(node.pk),
+        "nodegroupid": rule_config["nodegroup_id"],
+        "values": get_rule_match_values(rule_config, node),
+    }
+    resid_where = ""
+    if resourceids is not None:
+        params["resourceids"] = [str(i) for i in resourceids]
+        resid_where = "AND t.resourceinstanceid = ANY(%(resourceids)s::uuid[])"
+
+    if len(params["values"]) == 0:
+        return set()
+
+    if node.datatype == "string":
+        # i18n strings are stored as {"<lang>": {"value": ..., "direction": ...}}
+        sql = f"""SELECT DISTINCT t.resourceinstanceid FROM tiles t
+            CROSS JOIN LATERAL jsonb_each(
+                CASE jsonb_typeof(t.tiledata -> %(nodeid)s)
+                    WHEN 'object' THEN t.tiledata -> %(nodeid)s
+                    ELSE '{{}}'::jsonb
+                END
+            ) AS v(lang, val)
+            WHERE t.nodegroupid = %(nodegroupid)s
+                AND v.val ->> 'value' = ANY(%(values)s) {resid_where};"""
+    else:
+        # the node value may be a list (concept-list) or a single value
+        sql = f"""SELECT DISTINCT t.resourceinstanceid FROM tiles t
+            CROSS JOIN LATERAL jsonb_array_elements_text(
+                CASE jsonb_typeof(t.tiledata -> %(nodeid)s)
+                    WHEN 'array' THEN t.tiledata -> %(nodeid)s
+                    ELSE jsonb_build_array(t.tiledata -> %(nodeid)s)
+                END
+            ) AS v(val)
+            WHERE t.nodegroupid = %(nodegroupid)s
+                AND v.val = ANY(%(values)s) {resid_where};"""
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    return set([str(i[0]) for i in rows])
+
+
+def evaluate_management_rule_config(rule_config: dict, resourceids=None) -> set:
+    """Evaluates an AREA or AGENCY rule against the ResourceManagementArea or
+    ResourceManagementAgency projection, limited to the graph of the rule's
+    node."""
+
+    if "area_ids" in rule_config:
+        table, column, ids = (
+            "hms_resourcemanagementarea",
+            "area_id",
+            "%(ids)s::bigint[]",
+        )
+        params = {"ids": rule_config["area_ids"]}
+    else:
+        table, column, ids = (
+            "hms_resourcemanagementagency",
+            "agency_id",
+            "%(ids)s::text[]",
+        )
+        params = {"ids": rule_config["agency_codes"]}
+
+    if len(params["ids"]) == 0:
+        return set()
+
+    params["nodeid"] = rule_config["node_id"]
+    resid_where = ""
+    if resourceids is not None:
+        params["resourceids"] = [str(i) for i in resourceids]
+        resid_where = "AND p.resourceinstanceid = ANY(%(resourceids)s::uuid[])"
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""SELECT DISTINCT p.resourceinstanceid FROM {table} p
+            JOIN resource_instances ri ON ri.resourceinstanceid = p.resourceinstanceid
+            JOIN nodes n ON n.graphid = ri.graphid
+            WHERE n.nodeid = %(nodeid)s
+                AND p.{column} = ANY({ids}) {resid_where};""",
+            params,
+        )
+        rows = cursor.fetchall()
+
+    return set([str(i[0]) for i in rows])
+
+
+def build_accessible_resource_set(rule: Rule):
+    """Creates the AccessibleResourceSet for this rule and fills it with the ids
+    of every resource that currently satisfies the rule."""
+
+    from hms.models import AccessibleResourceSet, AccessibleResource
+
+    start = time.time()
+    with transaction.atomic():
+        resource_set = AccessibleResourceSet.objects.create(
+            signature=rule.signature,
+            graph_id=rule.graph_id,
+            nodegroup_id=rule.config["nodegroup_id"],
+            rule=rule.serialize(),
+        )
+        AccessibleResource.objects.bulk_create(
+            [
+                AccessibleResource(resource_set=resource_set, resourceinstanceid=i)
+                for i in evaluate_rule_for_resources(rule)
+            ],
+            batch_size=5000,
+        )
+    cache.delete(RESOURCE_SET_NODEGROUPS_KEY)
+
+    # a new set often replaces the set of a user's previous rule
+    prune_accessible_resource_sets()
+
+    logger.debug(f"build_accessible_resource_set: {time.time() - start}")
+    return resource_set
+
+
+def prune_accessible_resource_sets():
+    """Deletes the AccessibleResourceSets that have not been used for
+    ACCESSIBLE_RESOURCE_SET_MAX_AGE seconds, along with their members and
+    cluster pyramids, so they are no longer refreshed on every tile save."""
+
+    from hms.models import AccessibleResourceSet
+
+    cutoff = timezone.now() - timedelta(
+        seconds=settings.ACCESSIBLE_RESOURCE_SET_MAX_AGE
+    )
+    deleted, _ = AccessibleResourceSet.objects.filter(last_used__lt=cutoff).delete()
+    if deleted:
+        cache.delete(RESOURCE_SET_NODEGROUPS_KEY)
+
+
+def get_accessible_resource_set(rule: Rule):
+    """Returns the AccessibleResourceSet for this rule, building it the first
+    time the rule's signature is encountered. The set's last_used time is
+    updated at most once a day."""
+
+    from hms.models import AccessibleResourceSet
+
+    try:
+        resource_set = AccessibleResourceSet.objects.get(signature=rule.signature)
+        now = timezone.now()
+        if resource_set.last_used < now - timedelta(days=1):
+            AccessibleResourceSet.objects.filter(pk=resource_set.pk).update(
+                last_used=now
+            )
+            resource_set.last_used = now
+        return resource_set
+    except AccessibleResourceSet.DoesNotExist:
+        pass
+
+    try:
+        return build_accessible_resource_set(rule)
+    except IntegrityError:
+        # another process built the same set in the meantime
+        return AccessibleResourceSet.objects.get(signature=rule.signature)
+
+
+def get_accessible_resourceids(rule: Rule) -> set:
+    """Returns the set of resource ids that a resourceid_filter or
+    attribute_filter rule allows access to."""
+
+    if rule.type == "resourceid_filter":
+        return set([str(i) for i in rule.config["resourceids"]])
+
+    resource_set = get_accessible_resource_set(rule)
+    ids = resource_set.members.values_list("resourceinstanceid", flat=True)
+    return set([str(i) for i in ids])
+
+
+def get_resource_set_nodegroupids() -> set:
+    """Returns the ids of the nodegroups that at least one AccessibleResourceSet
+    depends on. Tile signals check this on every save, so it is cached, and
+    cleared whenever a new set is built."""
+
+    from hms.models import AccessibleResourceSet
+
+    nodegroupids = cache.get(RESOURCE_SET_NODEGROUPS_KEY)
+    if nodegroupids is None:
+        nodegroupids = set(
+            [
+                str(i)
+                for i in AccessibleResourceSet.objects.values_list(
+                    "nodegroup_id", flat=True
+                ).distinct()
+            ]
+        )
+        cache.set(
+            RESOURCE_SET_NODEGROUPS_KEY, nodegroupids, settings.RULE_CACHE_TIMEOUT
+        )
+    return nodegroupids
+
+
+@contextmanager
+def defer_accessible_resource_refresh():
+    """
+    Turns off the per-tile refresh of the management projection and the
+    accessible resource sets in this thread. Bulk jobs that save many tiles
+    use this, and call refresh_accessible_resources() once per batch instead.
+    """
+
+    depth = getattr(_resource_refresh, "deferred", 0)
+    _resource_refresh.deferred = depth + 1
+    try:
+        yield
+    finally:
+        _resource_refresh.deferred = depth
+
+
+def accessible_resource_refresh_is_deferred():
+    return getattr(_resource_refresh, "deferred", 0) > 0
+
+
+def refresh_accessible_resources(resourceids, nodegroupids=None):
+    """Incrementally re-evaluates every existing AccessibleResourceSet for the
+    given resources. This is called whenever tiles that rules depend on are
+    written, so the materialized sets stay current without a full rebuild.
+    Limit the sets that are refreshed by passing the nodegroupids that changed."""
+
+    from hms.models import AccessibleResourceSet, AccessibleResource
+
+    resourceids = [str(i) for i in resourceids]
+    if len(resourceids) == 0:
+        return
+
+    resource_sets = AccessibleResourceSet.objects.all()
+    if nodegroupids is not None:
+        resource_sets = resource_sets.filter(nodegroup_id__in=nodegroupids)
+
+    for resource_set in resource_sets:
+        matches = evaluate_rule_config(
+            resource_set.rule["config"], resourceids=resourceids
+        )
+        with transaction.atomic():
+            resource_set.members.filter(resourceinstanceid__in=resourceids).delete()
+            AccessibleResource.objects.bulk_create(
+                [
+                    AccessibleResource(resource_set=resource_set, resourceinstanceid=i)
+                    for i in matches
+                ]
+            )
+            resource_set.save()
+
+
 def generate_site_access_html(user):
     """This function should be called by a context_processor to dynamically generate HTML
-    content that is used in the rule filter component template. It can be altered as needed."""
+    content that is used in the rule filter component template. It can be altered as needed.
+    """
 
     ## ultimately, this should be dynamically driven directly by the rules this filter finds.
     ## for now though, there is a lot of hard-coded HMS logic
@@ -1,8 +1,16 @@
-from django.contrib.auth.models import Group
-from django.db.models.signals import post_save
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 
-from .models import Scout, ScoutProfile, LandManager
+from .models import (
+    Scout,
+    ScoutProfile,
+    LandManager,
+    ManagementArea,
+    ManagementAreaGroup,
+    ManagementAgency,
+)
+from .permissions_backend import clear_rule_cache
 
 
 @receiver(post_save, sender=Scout)
@@ -29,3 +37,43 @@ def create_user_land_manager(sender, instance, created, **kwargs):
         for gn in groups:
             g = Group.objects.get(name=gn)
             g.user_set.add(instance.user)
+
+
+## the following receivers keep the access rule cache in sync with the
+## profiles and management objects that the rules are derived from.
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Scout)
+def clear_user_rule_cache(sender, instance, **kwargs):
+    clear_rule_cache(instance)
+
+
+@receiver(post_save, sender=ScoutProfile)
+@receiver(post_delete, sender=ScoutProfile)
+@receiver(post_save, sender=LandManager)
+@receiver(post_delete, sender=LandManager)
+def clear_profile_rule_cache(sender, instance, **kwargs):
+    clear_rule_cache(instance.user)
+
+
+@receiver(m2m_changed, sender=LandManager.individual_areas.through)
+@receiver(m2m_changed, sender=LandManager.grouped_areas.through)
+def clear_land_manager_areas_rule_cache(sender, instance, **kwargs):
+    # the reverse side of this relation (area.landmanager_set.add()) can
+    # affect many users, so in that case clear everything
+    if isinstance(instance, LandManager):
+        clear_rule_cache(instance.user)
+    else:
+        clear_rule_cache()
+
+
+@receiver(post_save, sender=ManagementArea)
+@receiver(post_delete, sender=ManagementArea)
+@receiver(post_save, sender=ManagementAreaGroup)
+@receiver(post_delete, sender=ManagementAreaGroup)
+@receiver(post_save, sender=ManagementAgency)
+@receiver(post_delete, sender=ManagementAgency)
+@receiver(m2m_changed, sender=ManagementAreaGroup.areas.through)
+def clear_all_rule_cache(sender, **kwargs):
+    clear_rule_cache()
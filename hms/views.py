@@ -1,7 +1,5 @@
 import csv
 from io import BytesIO
-import json
-from pathlib import Path
 import logging
 from datetime import datetime
 from typing import Tuple
@@ -36,6 +34,7 @@ from arches.app.models.system_settings import settings
 from arches.app.views.user import UserManagerView
 
 from fpan.decorators import user_is_scout_decorator
+from fpan.utils import get_county_lookup
 from hms.fmsf import FMSFResource
 from hms.forms import ScoutForm, ScoutProfileForm
 from hms.models import (
@@ -330,8 +329,7 @@ def scouts_dropdown(request):
     ## otherwise, get region for this resource, and only return scouts
     ## who are intersted in scouting in that region
     if resourceid:
-        with open(Path(settings.APP_ROOT, "data", "county_lookup.json"), "r") as o:
-            lookup = json.load(o)
+        lookup = get_county_lookup()
         res = FMSFResource.from_arches(resourceid)
         if res.siteid:
             entry = lookup.get(res.siteid[:2])
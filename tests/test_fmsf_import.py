@@ -0,0 +1,152 @@
+import json
+import uuid
+import shutil
+import tempfile
+from contextlib import ExitStack
+from unittest import mock
+
+from django.core import management
+from django.db import connection
+
+from fpan.etl_modules.fmsf_importer import CHECKPOINT_KEY, FMSFImporter
+from fpan.utils import ETLOperationResult
+
+from .base_test import HMSTestCase
+
+
+def get_load_details(loadid) -> dict:
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """SELECT load_details FROM load_event WHERE loadid = %s""", [loadid]
+        )
+        details = cursor.fetchone()[0]
+    return details if isinstance(details, dict) else json.loads(details)
+
+
+def patch_stages(stages) -> ExitStack:
+    """Replaces the named FMSFImporter methods with the given functions, which
+    receive the importer as their first argument."""
+
+    stack = ExitStack()
+    for name, side_effect in stages.items():
+        stack.enter_context(
+            mock.patch.object(
+                FMSFImporter, name, autospec=True, side_effect=side_effect
+            )
+        )
+    return stack
+
+
+class FMSFImportTests(HMSTestCase):
+    @classmethod
+    def setUpClass(cls):
+        management.call_command("setup_hms", use_existing_db=True)
+
+    def setUp(self):
+        self.file_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.file_dir, ignore_errors=True)
+
+    def test_staging_batches(self):
+
+        importer = FMSFImporter()
+        importer.loadid = str(uuid.uuid4())
+        importer.file_dir = self.file_dir
+        importer.reporter = ETLOperationResult(
+            "fmsf_import", loadid=importer.loadid, data={}
+        )
+        importer._set_resource_type("Archaeological Site")
+        importer.initialize_load_event()
+
+        nodegroupid = str(importer.get_node("FMSF ID").nodegroup_id)
+        resourceid = str(uuid.uuid4())
+        tiles = [
+            (
+                nodegroupid,
+                f"XX{i:05}",
+                resourceid,
+                str(uuid.uuid4()),
+                None,
+                json.dumps({}),
+                importer.loadid,
+                0,
+                "AR.csv",
+                True,
+            )
+            for i in range(5)
+        ]
+        importer.reporter.data["Tiles staged"] = 0
+        importer.write_data_to_load_staging(tiles, batch_size=2)
+
+        self.assertEqual(importer.reporter.data["Tiles staged"], 5)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """SELECT count(*) FROM load_staging WHERE loadid = %s""",
+                [importer.loadid],
+            )
+            self.assertEqual(cursor.fetchone()[0], 5)
+
+    def test_resume_after_staging(self):
+
+        loadid = str(uuid.uuid4())
+        calls = []
+
+        def record(name, **kwargs):
+            def _stage(importer, *args, **_kwargs):
+                calls.append(name)
+                for attr, value in kwargs.items():
+                    setattr(importer, attr, value)
+
+            return _stage
+
+        def interrupt(importer):
+            calls.append("write tiles")
+            importer.reporter.success = False
+            importer.reporter.message = "interrupted"
+
+        stages = {
+            "validate_files": record("validate"),
+            "_set_resource_lookup": record("lookup"),
+            "read_features_from_shapefile": record(
+                "read", new_siteids={"XX00001", "XX00002"}
+            ),
+            "generate_load_data": record("generate"),
+            "check_load_staging": record("check staging"),
+            "write_tiles_from_load_staging": interrupt,
+            "run_spatial_join": record("spatial join"),
+            "finalize_indexing": record("finalize"),
+        }
+
+        # the first run stops after the data is staged
+        with patch_stages(stages):
+            FMSFImporter().run_sequence(
+                "Archaeological Site", loadid=loadid, file_dir=self.file_dir
+            )
+
+        self.assertEqual(
+            calls,
+            ["validate", "lookup", "read", "generate", "check staging", "write tiles"],
+        )
+        self.assertEqual(
+            get_load_details(loadid)[CHECKPOINT_KEY],
+            ["read", "generate", "check staging"],
+        )
+
+        # the resumed run picks up at writing tiles
+        calls.clear()
+        stages["write_tiles_from_load_staging"] = record("write tiles")
+        with patch_stages(stages):
+            FMSFImporter().run_sequence(
+                "Archaeological Site",
+                loadid=loadid,
+                file_dir=self.file_dir,
+                resume=True,
+            )
+
+        self.assertEqual(calls, ["validate", "write tiles", "spatial join", "finalize"])
+        self.assertEqual(
+            get_load_details(loadid)[CHECKPOINT_KEY],
+            ["read", "generate", "check staging", "write tiles", "spatial join"],
+        )
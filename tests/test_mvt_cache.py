@@ -0,0 +1,61 @@
+from django.conf import settings
+
+from fpan.utils import (
+    MERCATOR_MAX,
+    defer_mvt_invalidation,
+    get_mvt_cache_key,
+    get_tile_indexes,
+    invalidate_mvt_tiles,
+)
+
+from .base_test import HMSTestCase
+
+NODEID = "00000000-0000-0000-0000-000000000000"
+SIGNATURE = "test"
+
+# a small bbox in EPSG:3857, near Tallahassee
+SMALL_BBOX = (-9380000, 3555000, -9379990, 3555010)
+WORLD_BBOX = (-MERCATOR_MAX, -MERCATOR_MAX, MERCATOR_MAX, MERCATOR_MAX)
+
+
+def get_key(zoom, x, y):
+    return get_mvt_cache_key(NODEID, SIGNATURE, zoom, x, y)
+
+
+class MVTCacheTests(HMSTestCase):
+    def test_invalidate_small_bbox(self):
+
+        zoom = settings.MVT_CACHE_MAX_ZOOM
+        xs, ys = get_tile_indexes(zoom, *SMALL_BBOX)
+        inside = (zoom, xs.start, ys.start)
+        outside = (zoom, xs.start + 10, ys.start + 10)
+
+        inside_key, outside_key = get_key(*inside), get_key(*outside)
+        invalidate_mvt_tiles(SMALL_BBOX)
+
+        self.assertNotEqual(get_key(*inside), inside_key)
+        self.assertEqual(get_key(*outside), outside_key)
+
+    def test_invalidate_large_bbox(self):
+
+        # too many tiles at the higher zooms, so every tile is invalidated
+        key = get_key(0, 0, 0)
+        far_key = get_key(settings.MVT_CACHE_MAX_ZOOM, 0, 0)
+        invalidate_mvt_tiles(WORLD_BBOX)
+
+        self.assertNotEqual(get_key(0, 0, 0), key)
+        self.assertNotEqual(get_key(settings.MVT_CACHE_MAX_ZOOM, 0, 0), far_key)
+
+    def test_deferred_invalidation(self):
+
+        zoom = settings.MVT_CACHE_MAX_ZOOM
+        xs, ys = get_tile_indexes(zoom, *SMALL_BBOX)
+        far = (zoom, xs.start + 10, ys.start + 10)
+
+        with defer_mvt_invalidation():
+            key, far_key = get_key(zoom, xs.start, ys.start), get_key(*far)
+            invalidate_mvt_tiles(SMALL_BBOX)
+            self.assertEqual(get_key(zoom, xs.start, ys.start), key)
+
+        # the generation is replaced on exit
+        self.assertNotEqual(get_key(*far), far_key)
@@ -0,0 +1,135 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import management
+from django.utils import timezone
+
+from hms.models import (
+    AccessibleResourceSet,
+    ResourceManagementArea,
+    ResourceManagementAgency,
+)
+from hms.permissions_backend import (
+    get_accessible_resource_set,
+    get_archaeological_site_rule,
+    prune_accessible_resource_sets,
+    user_can_access,
+)
+
+from .base_test import HMSTestCase
+
+# resources from tests/data/resources/test_archaeological_sites.json
+SITE_ASSIGNED_TO_FDHARDY = "43c0ee0d-6d80-4147-9a01-4600177e24d1"
+SITE_ASSIGNED_TO_BAHOOPER = "de16200d-8a6f-4f42-b74e-d3df796c41d0"
+SITE_UNASSIGNED = "1a2d1325-8a10-4380-832e-621eeebc63c5"
+ALL_SITES = [
+    SITE_ASSIGNED_TO_FDHARDY,
+    SITE_ASSIGNED_TO_BAHOOPER,
+    SITE_UNASSIGNED,
+    "b02c9584-6aea-47a3-9db2-e4130aee7f6a",
+    "4167bc52-baa9-4175-9c99-94665881373b",
+    "4c0b75b4-583a-4152-a93d-a1094c2d46ae",
+    "02c333af-cb0f-4093-8949-14fe1ced610b",
+    "16af0d74-cd98-4ccc-8318-71d52235dc0e",
+    "05487caf-a9b4-48ce-b063-8de385930371",
+    "9a095f06-6463-49d5-80c9-f73e9c11d2f5",
+]
+
+# resources from tests/data/resources/test_scout_reports.json
+REPORT_FOR_FDHARDY_SITE = "094a2a2f-180d-4c5f-915f-65959549656b"
+REPORT_FOR_UNASSIGNED_SITE = "1c7a5055-5dd7-45d3-863b-725f5c0f8b33"
+
+
+class PermissionsTests(HMSTestCase):
+    @classmethod
+    def setUpClass(cls):
+        management.call_command("setup_hms", use_existing_db=True)
+
+        from hms.utils import TestUtils
+
+        TestUtils().create_test_scouts()
+        TestUtils().create_test_landmanagers()
+        TestUtils().load_test_resources()
+
+    def test_state_full_access(self):
+
+        user = User.objects.get(username="TestFPANOffice")
+        self.assertEqual(get_archaeological_site_rule(user).type, "full_access")
+        for siteid in ALL_SITES:
+            self.assertTrue(user_can_access(user, siteid))
+
+    def test_land_manager_no_access(self):
+
+        user = User.objects.get(username="TestBanishedLM")
+        self.assertEqual(get_archaeological_site_rule(user).type, "no_access")
+        for siteid in ALL_SITES:
+            self.assertFalse(user_can_access(user, siteid))
+
+    def test_land_manager_area_access(self):
+
+        user = User.objects.get(username="TestMatanzasSF")
+        rule = get_archaeological_site_rule(user)
+        self.assertEqual(rule.type, "attribute_filter")
+
+        area_ids = [i.pk for i in user.landmanager.all_areas]
+        for siteid in ALL_SITES:
+            in_area = ResourceManagementArea.objects.filter(
+                resourceinstanceid=siteid, area_id__in=area_ids
+            ).exists()
+            self.assertEqual(user_can_access(user, siteid), in_area)
+
+    def test_land_manager_agency_access(self):
+
+        user = User.objects.get(username="TestAdminSF")
+        rule = get_archaeological_site_rule(user)
+        self.assertEqual(rule.type, "attribute_filter")
+
+        for siteid in ALL_SITES:
+            in_agency = ResourceManagementAgency.objects.filter(
+                resourceinstanceid=siteid, agency_id="FFS"
+            ).exists()
+            self.assertEqual(user_can_access(user, siteid), in_agency)
+
+    def test_scout_assigned_site_access(self):
+
+        user = User.objects.get(username="fdhardy")
+        rule = get_archaeological_site_rule(user)
+        self.assertEqual(rule.type, "attribute_filter")
+        self.assertEqual(
+            rule.config["node_id"], settings.ARCHAEOLOGICAL_SITE_ASSIGNMENT_NODE_ID
+        )
+
+        self.assertTrue(user_can_access(user, SITE_ASSIGNED_TO_FDHARDY))
+        self.assertFalse(user_can_access(user, SITE_ASSIGNED_TO_BAHOOPER))
+        self.assertFalse(user_can_access(user, SITE_UNASSIGNED))
+
+        other = User.objects.get(username="bahooper")
+        self.assertTrue(user_can_access(other, SITE_ASSIGNED_TO_BAHOOPER))
+        self.assertFalse(user_can_access(other, SITE_ASSIGNED_TO_FDHARDY))
+
+    def test_scout_report_access(self):
+
+        user = User.objects.get(username="fdhardy")
+        self.assertTrue(user_can_access(user, REPORT_FOR_FDHARDY_SITE))
+        self.assertFalse(user_can_access(user, REPORT_FOR_UNASSIGNED_SITE))
+
+    def test_prune_resource_sets(self):
+
+        user = User.objects.get(username="TestMatanzasSF")
+        resource_set = get_accessible_resource_set(get_archaeological_site_rule(user))
+
+        prune_accessible_resource_sets()
+        self.assertTrue(
+            AccessibleResourceSet.objects.filter(pk=resource_set.pk).exists()
+        )
+
+        # a set that has not been used recently is removed
+        AccessibleResourceSet.objects.filter(pk=resource_set.pk).update(
+            last_used=timezone.now()
+            - timedelta(seconds=settings.ACCESSIBLE_RESOURCE_SET_MAX_AGE + 1)
+        )
+        prune_accessible_resource_sets()
+        self.assertFalse(
+            AccessibleResourceSet.objects.filter(pk=resource_set.pk).exists()
+        )
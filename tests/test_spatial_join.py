@@ -0,0 +1,102 @@
+from django.contrib.gis.geos import GEOSGeometry
+from django.core import management
+from django.db import connection
+
+from hms.models import ManagementArea, ResourceManagementArea
+from fpan.utils import SpatialJoin
+
+from .base_test import HMSTestCase
+
+# a resource from tests/data/resources/test_archaeological_sites.json
+TEST_SITEID = "43c0ee0d-6d80-4147-9a01-4600177e24d1"
+
+
+def get_intersecting_area_ids(resourceid) -> set:
+    """Reads the management areas that intersect a resource directly from the
+    geometries, to check the join results against."""
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """SELECT DISTINCT ma.id FROM hms_managementarea ma
+            JOIN geojson_geometries gg
+                ON ST_Intersects(gg.geom, ST_Transform(ma.geom, 3857))
+            WHERE gg.resourceinstanceid = %s;""",
+            [resourceid],
+        )
+        return set([i[0] for i in cursor.fetchall()])
+
+
+def get_joined_area_ids(resourceid) -> set:
+    return set(
+        ResourceManagementArea.objects.filter(
+            resourceinstanceid=resourceid
+        ).values_list("area_id", flat=True)
+    )
+
+
+class SpatialJoinTests(HMSTestCase):
+    @classmethod
+    def setUpClass(cls):
+        management.call_command("setup_hms", use_existing_db=True)
+
+        from hms.utils import TestUtils
+
+        TestUtils().load_test_resources()
+
+    def test_bulk_join(self):
+
+        joiner = SpatialJoin("Archaeological Site")
+        joiner.update_graph(index=False)
+
+        resourceids = joiner.get_resources_for_area_changes(
+            list(ManagementArea.objects.values_list("pk", flat=True)), []
+        )
+        for resourceid in resourceids:
+            self.assertEqual(
+                get_joined_area_ids(resourceid),
+                get_intersecting_area_ids(resourceid),
+            )
+
+    def test_incremental_join(self):
+
+        SpatialJoin("Archaeological Site").update_resources([TEST_SITEID], index=False)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """SELECT ST_AsText(ST_Multi(ST_Buffer(
+                    ST_Transform(ST_Envelope(geom), 4326), 0.001
+                ))) FROM geojson_geometries WHERE resourceinstanceid = %s
+                LIMIT 1;""",
+                [TEST_SITEID],
+            )
+            wkt = cursor.fetchone()[0]
+
+        # a new area around the site is added to it. the area's concept is only
+        # created once it has a pk, so the join runs after its second save.
+        area = ManagementArea(name="Test Join Area", geom=GEOSGeometry(wkt, srid=4326))
+        area.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            area.save()
+        self.assertIn(area.pk, get_joined_area_ids(TEST_SITEID))
+
+        # moving the area away removes it from the site
+        area.geom = GEOSGeometry(
+            "MULTIPOLYGON(((0 0, 0 0.001, 0.001 0.001, 0.001 0, 0 0)))", srid=4326
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            area.save()
+        self.assertNotIn(area.pk, get_joined_area_ids(TEST_SITEID))
+        self.assertEqual(
+            get_joined_area_ids(TEST_SITEID), get_intersecting_area_ids(TEST_SITEID)
+        )
+
+        # moving it back, then deleting it, removes it again
+        area.geom = GEOSGeometry(wkt, srid=4326)
+        with self.captureOnCommitCallbacks(execute=True):
+            area.save()
+        self.assertIn(area.pk, get_joined_area_ids(TEST_SITEID))
+
+        area_id = area.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            area.delete()
+        self.assertNotIn(area_id, get_joined_area_ids(TEST_SITEID))